@@ -0,0 +1,305 @@
+"""
+Headless batch editing of a PDF without the web server.
+
+Usage:
+    python -m execution.batch_edit input.pdf edits.json -o output.pdf [--workers 4] [--memory-limit-mb 8000]
+
+Edit spec (JSON):
+    {
+      "defaults": {"font_family": "NotoSansTC", "text_color": "#000000"},
+      "edits": [
+        {"page": 0,   "bbox": [x, y, w, h], "text": "New title", "style": {"is_bold": true}},
+        {"page": "*", "match": "Old footer", "text": "New footer"}
+      ]
+    }
+
+    - page:  int, list of ints, or "*" / omitted for every page.
+    - bbox:  [x, y, w, h] in raster pixels at --dpi (same coordinates as the web editor).
+    - match: OCR text to look for instead of a bbox. Every OCR block containing it is edited;
+             the matched substring is replaced by "text" (the rest of the block is kept).
+    - style: Any apply_edit keyword (font_family, font_size, text_color, is_bold, is_italic,
+             inpaint_method, fill_color, offset_x, offset_y, fill_size). Overrides "defaults".
+
+Pages stream through rasterize -> OCR (only when needed) -> edit in worker processes;
+the main process assembles finished pages in order. Pages without edits are copied
+from the source PDF untouched.
+"""
+import argparse
+import json
+import logging
+import os
+import shutil
+import sys
+import tempfile
+import time
+from collections import defaultdict, deque
+from concurrent.futures import ProcessPoolExecutor
+from typing import Any, Dict, List, Optional
+
+logger = logging.getLogger(__name__)
+
+STYLE_KEYS = {
+    "font_family", "font_size", "text_color", "is_bold", "is_italic",
+    "inpaint_method", "fill_color", "offset_x", "offset_y", "fill_size",
+}
+
+# Rough resident size of one worker with PaddleOCR + LaMa loaded (MB)
+WORKER_BASE_MEMORY_MB = 1500
+# Working copies of a page raster held by one worker (RGB original, inpaint input/output, mask)
+RASTER_COPIES = 4
+
+STAGES = ("rasterize", "ocr", "edit", "assemble")
+
+def load_spec(spec_path: str) -> Dict[str, Any]:
+    """Load and validate an edit spec file."""
+    with open(spec_path, "r", encoding="utf-8") as f:
+        spec = json.load(f)
+
+    edits = spec.get("edits")
+    if not isinstance(edits, list):
+        raise ValueError("Edit spec must contain an 'edits' list.")
+
+    for n, edit in enumerate(edits):
+        if "text" not in edit:
+            raise ValueError(f"Edit #{n}: 'text' is required.")
+        if ("bbox" in edit) == ("match" in edit):
+            raise ValueError(f"Edit #{n}: exactly one of 'bbox' or 'match' is required.")
+        if "bbox" in edit and len(edit["bbox"]) != 4:
+            raise ValueError(f"Edit #{n}: 'bbox' must be [x, y, w, h].")
+        unknown = set(edit.get("style", {})) - STYLE_KEYS
+        if unknown:
+            raise ValueError(f"Edit #{n}: unknown style keys {sorted(unknown)}.")
+
+    unknown = set(spec.get("defaults", {})) - STYLE_KEYS
+    if unknown:
+        raise ValueError(f"Unknown default style keys {sorted(unknown)}.")
+    return spec
+
+def edits_by_page(spec: Dict[str, Any], page_count: int) -> Dict[int, List[Dict[str, Any]]]:
+    """Expand the spec into an ordered edit list per page index (spec order is kept)."""
+    defaults = spec.get("defaults", {})
+    pages = defaultdict(list)
+
+    for edit in spec["edits"]:
+        target = edit.get("page", "*")
+        if target == "*":
+            indices = range(page_count)
+        elif isinstance(target, list):
+            indices = target
+        else:
+            indices = [target]
+
+        style = dict(defaults)
+        style.update(edit.get("style", {}))
+        for i in indices:
+            if not 0 <= int(i) < page_count:
+                raise ValueError(f"Page {i} out of range (document has {page_count} pages).")
+            pages[int(i)].append({
+                "bbox": edit.get("bbox"),
+                "match": edit.get("match"),
+                "text": edit["text"],
+                "style": style,
+            })
+    return pages
+
+def plan_workers(requested: int, memory_limit_mb: Optional[int], max_raster_mb: float) -> int:
+    """Cap the worker count so that all workers fit in memory_limit_mb."""
+    workers = max(1, requested)
+    if memory_limit_mb:
+        per_worker = WORKER_BASE_MEMORY_MB + max_raster_mb * RASTER_COPIES
+        fit = int(memory_limit_mb // per_worker)
+        if fit < 1:
+            raise ValueError(f"memory limit {memory_limit_mb} MB is below one worker (~{int(per_worker)} MB).")
+        workers = min(workers, fit)
+    return workers
+
+# --- Worker side ---
+
+_worker_doc = None
+
+def _init_worker(pdf_path: str, threads: int):
+    """Open the source PDF once per worker and keep engine thread pools within this worker's share."""
+    global _worker_doc
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS"):
+        os.environ[var] = str(threads)
+    # A worker runs OCR and the edit of a page one after the other: each engine may use
+    # the whole share. Set before the engines load (cpu_scheduler reads it at import),
+    # and reconfigure if a forked worker inherited it already imported.
+    for var in ("CPU_CORES", "OCR_THREADS", "INPAINT_THREADS"):
+        os.environ[var] = str(threads)
+    if "execution.cpu_scheduler" in sys.modules:
+        sys.modules["execution.cpu_scheduler"].configure(threads, threads, threads)
+    try:
+        import cv2
+        cv2.setNumThreads(threads)
+    except ImportError:
+        pass
+
+    import fitz
+    _worker_doc = fitz.open(pdf_path)
+
+def _process_page(page_index: int, page_edits: List[Dict[str, Any]], work_dir: str,
+                  dpi: int, ocr_engine_name: str) -> Dict[str, Any]:
+    """Rasterize, OCR (if any edit needs text matching) and edit one page. Runs in a worker."""
+    from execution import process_pdf, ocr_engine, editor_engine
+
+    timings = {}
+    start = time.perf_counter()
+    geom = process_pdf.render_page(_worker_doc, page_index, work_dir, dpi=dpi)
+    image_path = os.path.join(work_dir, geom["image"])
+    timings["rasterize"] = time.perf_counter() - start
+
+    blocks = None
+    if any(e["match"] for e in page_edits):
+        start = time.perf_counter()
+        blocks = ocr_engine.analyze_image(image_path, engine=ocr_engine_name)
+        timings["ocr"] = time.perf_counter() - start
+
+    # Resolve match edits to concrete bboxes
+    resolved = []
+    for edit in page_edits:
+        if edit["bbox"] is not None:
+            resolved.append((edit["bbox"], edit["text"], edit["style"]))
+            continue
+        for block in blocks:
+            if edit["match"] in block["text"]:
+                new_text = block["text"].replace(edit["match"], edit["text"])
+                resolved.append((block["bbox"], new_text, edit["style"]))
+
+    start = time.perf_counter()
+    for bbox, text, style in resolved:
+        editor_engine.apply_edit(image_path, bbox, text, restore_first=False, **style)
+    timings["edit"] = time.perf_counter() - start
+
+    if not resolved:
+        os.remove(image_path)
+        image_path = None
+
+    return {"page_index": page_index, "image_path": image_path, "edits": len(resolved), "timings": timings}
+
+# --- Main side ---
+
+def run(pdf_path: str, spec_path: str, output_path: str, workers: int = 0,
+        memory_limit_mb: Optional[int] = None, max_inflight: int = 0,
+        dpi: int = 200, ocr_engine_name: str = "paddle") -> Dict[str, Any]:
+    """
+    Apply an edit spec to a PDF and write the result. Returns a summary dict.
+    """
+    import fitz
+
+    total_start = time.perf_counter()
+    spec = load_spec(spec_path)
+
+    src = fitz.open(pdf_path)
+    page_count = len(src)
+    pages = edits_by_page(spec, page_count)
+
+    # Largest raster any edited page will produce (MB), for the memory plan
+    zoom = dpi / 72.0
+    max_raster_mb = 0.0
+    for i in pages:
+        rect = src.load_page(i).rect
+        max_raster_mb = max(max_raster_mb, rect.width * zoom * rect.height * zoom * 3 / 1e6)
+
+    cpus = os.cpu_count() or 1
+    workers = plan_workers(workers or cpus, memory_limit_mb, max_raster_mb)
+    max_inflight = max_inflight or workers * 2
+    threads = max(1, cpus // workers)
+    logger.info(f"{page_count} pages, {len(pages)} with edits, {workers} workers x {threads} threads, "
+                f"max {max_inflight} pages in flight")
+
+    stage_totals = defaultdict(float)
+    edit_count = 0
+    work_dir = tempfile.mkdtemp(prefix="batch_edit_")
+    out = fitz.open()
+
+    def assemble(result):
+        i = result["page_index"]
+        start = time.perf_counter()
+        if result["image_path"]:
+            rect = src.load_page(i).rect
+            page = out.new_page(width=rect.width, height=rect.height)
+            page.insert_image(rect, filename=result["image_path"])
+            os.remove(result["image_path"])
+            original = result["image_path"] + ".original"
+            if os.path.exists(original):
+                os.remove(original)
+        else:
+            out.insert_pdf(src, from_page=i, to_page=i)
+        stage_totals["assemble"] += time.perf_counter() - start
+
+    try:
+        with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                 initargs=(pdf_path, threads)) as pool:
+            # Pages are submitted in order and assembled in order; at most max_inflight
+            # pages are queued or finished-but-unassembled at any time.
+            inflight = deque()
+            done = 0
+            for i in range(page_count):
+                if i in pages:
+                    fut = pool.submit(_process_page, i, pages[i], work_dir, dpi, ocr_engine_name)
+                else:
+                    fut = None
+                inflight.append((i, fut))
+
+                while len(inflight) >= max_inflight or (inflight and inflight[0][1] is None):
+                    done, edit_count = _drain_one(inflight, assemble, stage_totals, done, edit_count, page_count)
+
+            while inflight:
+                done, edit_count = _drain_one(inflight, assemble, stage_totals, done, edit_count, page_count)
+
+        out.save(output_path, garbage=3, deflate=True)
+    finally:
+        out.close()
+        src.close()
+        shutil.rmtree(work_dir, ignore_errors=True)
+
+    total = time.perf_counter() - total_start
+    return {
+        "pages": page_count,
+        "edited_pages": len(pages),
+        "edits_applied": edit_count,
+        "workers": workers,
+        "total_s": round(total, 2),
+        "pages_per_s": round(page_count / total, 2) if total > 0 else None,
+        "stage_time_s": {k: round(stage_totals[k], 2) for k in STAGES},
+    }
+
+def _drain_one(inflight, assemble, stage_totals, done, edit_count, page_count):
+    i, fut = inflight.popleft()
+    if fut is None:
+        assemble({"page_index": i, "image_path": None})
+        edits = 0
+    else:
+        result = fut.result()
+        for stage, secs in result["timings"].items():
+            stage_totals[stage] += secs
+        assemble(result)
+        edits = result["edits"]
+    done += 1
+    print(f"[{done}/{page_count}] page {i}: {edits} edit(s)", file=sys.stderr)
+    return done, edit_count + edits
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Apply an edit spec to a PDF without the web server.")
+    parser.add_argument("pdf", help="Input PDF")
+    parser.add_argument("spec", help="Edit spec JSON")
+    parser.add_argument("-o", "--output", required=True, help="Output PDF")
+    parser.add_argument("--workers", type=int, default=0, help="Worker processes (default: CPU count)")
+    parser.add_argument("--memory-limit-mb", type=int, default=None,
+                        help="Total memory budget; caps the number of workers")
+    parser.add_argument("--max-inflight", type=int, default=0,
+                        help="Max pages queued or awaiting assembly (default: 2 x workers)")
+    parser.add_argument("--dpi", type=int, default=200, help="Render DPI (bbox coordinates use this DPI)")
+    parser.add_argument("--ocr-engine", default="paddle", help="OCR engine for 'match' edits")
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO, format="%(asctime)s - %(name)s - %(levelname)s - %(message)s")
+
+    summary = run(args.pdf, args.spec, args.output, workers=args.workers,
+                  memory_limit_mb=args.memory_limit_mb, max_inflight=args.max_inflight,
+                  dpi=args.dpi, ocr_engine_name=args.ocr_engine)
+    print(json.dumps(summary, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,101 @@
+"""
+Per-session storage of OCR blocks and detection of elements repeated across pages
+(footers, watermarks, titles at the same position on most slides).
+"""
+import json
+import os
+import re
+import unicodedata
+from typing import Any, Dict, List, Optional
+
+from execution import coords
+
+BLOCKS_FILE = "blocks_{}.json"
+BLOCKS_PATTERN = re.compile(r"^blocks_(\d+)\.json$")
+
+# Two blocks on different pages are the same element if their text matches after
+# normalization and their boxes differ by at most this much (PDF points)
+REPEAT_TOLERANCE_PT = 6.0
+
+def save_page_blocks(session_dir: str, page_index: int, blocks: List[Dict[str, Any]]):
+    path = os.path.join(session_dir, BLOCKS_FILE.format(page_index))
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump(blocks, f, ensure_ascii=False)
+    os.replace(tmp_path, path)
+
+def load_page_blocks(session_dir: str, page_index: int) -> Optional[List[Dict[str, Any]]]:
+    path = os.path.join(session_dir, BLOCKS_FILE.format(page_index))
+    if not os.path.exists(path):
+        return None
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f)
+
+def load_all_blocks(session_dir: str) -> Dict[int, List[Dict[str, Any]]]:
+    """OCR blocks of every analyzed page, keyed by page index."""
+    pages = {}
+    for name in os.listdir(session_dir):
+        m = BLOCKS_PATTERN.match(name)
+        if m:
+            pages[int(m.group(1))] = load_page_blocks(session_dir, int(m.group(1)))
+    return dict(sorted(pages.items()))
+
+def normalize_text(text: str) -> str:
+    """NFKC, case-folded, whitespace collapsed."""
+    text = unicodedata.normalize("NFKC", text)
+    return re.sub(r"\s+", " ", text).strip().casefold()
+
+def _bbox_pt(bbox: List[float], geom: Optional[Dict[str, Any]]) -> List[float]:
+    return coords.px_to_pt(bbox, geom) if geom else list(bbox)
+
+def _same_place(a: List[float], b: List[float], tol: float) -> bool:
+    return all(abs(u - v) <= tol for u, v in zip(a, b))
+
+def find_repeated(session_dir: str, min_pages: int = 2, tol: float = REPEAT_TOLERANCE_PT) -> List[Dict[str, Any]]:
+    """
+    Group OCR blocks across analyzed pages by normalized text and near-identical bbox.
+    Returns groups present on at least min_pages pages, most frequent first:
+        [{group_id, text, occurrences: [{page_index, block_id, bbox}]}]
+    """
+    geometries = {g["index"]: g for g in coords.load_geometry(session_dir)}
+
+    # text -> list of clusters; each cluster: reference bbox (pt) + occurrences
+    clusters: Dict[str, List[Dict[str, Any]]] = {}
+    for page_index, blocks in load_all_blocks(session_dir).items():
+        geom = geometries.get(page_index)
+        for block in blocks or []:
+            key = normalize_text(block["text"])
+            if not key:
+                continue
+            box = _bbox_pt(block["bbox"], geom)
+            occurrence = {"page_index": page_index, "block_id": block["id"], "bbox": block["bbox"]}
+            for cluster in clusters.setdefault(key, []):
+                if _same_place(cluster["ref"], box, tol):
+                    cluster["occurrences"].append(occurrence)
+                    break
+            else:
+                clusters[key].append({"ref": box, "text": block["text"], "occurrences": [occurrence]})
+
+    groups = []
+    for cluster_list in clusters.values():
+        for cluster in cluster_list:
+            # One occurrence per page (first block wins if a page repeats the text nearby)
+            by_page = {}
+            for occ in cluster["occurrences"]:
+                by_page.setdefault(occ["page_index"], occ)
+            if len(by_page) >= min_pages:
+                groups.append({"text": cluster["text"], "occurrences": list(by_page.values())})
+
+    groups.sort(key=lambda g: (-len(g["occurrences"]), g["text"]))
+    for n, group in enumerate(groups):
+        group["group_id"] = f"g{n}"
+    return groups
+
+def find_occurrences(session_dir: str, page_index: int, block_id: int,
+                     tol: float = REPEAT_TOLERANCE_PT) -> List[Dict[str, Any]]:
+    """All occurrences (including the block itself) of the element containing this block."""
+    for group in find_repeated(session_dir, min_pages=1, tol=tol):
+        for occ in group["occurrences"]:
+            if occ["page_index"] == page_index and occ["block_id"] == block_id:
+                return group["occurrences"]
+    return []
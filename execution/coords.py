@@ -0,0 +1,98 @@
+"""
+Coordinate mapping between PDF points, raster pixels and preview pixels.
+
+Each page is rendered at its own DPI, so a page's geometry (recorded in the session's
+pages.json) is needed to convert coordinates:
+    - pt:      PDF user space (1/72 inch), origin top-left as in PyMuPDF.
+    - px:      Pixels of the rendered page image (page_N.png). OCR and editing work here.
+    - preview: Pixels of the page image as displayed at some width in the browser.
+
+All bboxes are [x, y, w, h].
+"""
+import json
+import os
+from typing import Any, Dict, List, Optional
+
+GEOMETRY_FILE = "pages.json"
+
+def make_geometry(index: int, width_pt: float, height_pt: float,
+                  width_px: int, height_px: int, dpi: Optional[float],
+                  image_rect: Optional[List[float]] = None) -> Dict[str, Any]:
+    """
+    Geometry record for one page. scale_x / scale_y are raster pixels per PDF point.
+    image_rect ([x0, y0, x1, y1] pt) is the page area the raster covers when it is not
+    exactly the page (an extracted embedded image); its top-left is recorded as origin_x / origin_y.
+    """
+    x0, y0, x1, y1 = image_rect if image_rect else (0.0, 0.0, width_pt, height_pt)
+    return {
+        "index": index,
+        "width_pt": width_pt,
+        "height_pt": height_pt,
+        "width_px": width_px,
+        "height_px": height_px,
+        "dpi": dpi,
+        "scale_x": width_px / (x1 - x0) if x1 > x0 else 1.0,
+        "scale_y": height_px / (y1 - y0) if y1 > y0 else 1.0,
+        "origin_x": x0,
+        "origin_y": y0,
+    }
+
+def image_geometry(index: int, width_px: int, height_px: int) -> Dict[str, Any]:
+    """Geometry for an image upload: 1 px = 1 pt (72 dpi), as PIL writes image PDFs by default."""
+    return make_geometry(index, float(width_px), float(height_px), width_px, height_px, 72.0)
+
+def save_geometry(session_dir: str, pages: List[Dict[str, Any]]):
+    path = os.path.join(session_dir, GEOMETRY_FILE)
+    tmp_path = path + ".tmp"
+    with open(tmp_path, "w", encoding="utf-8") as f:
+        json.dump({"pages": pages}, f)
+    os.replace(tmp_path, path)
+
+def load_geometry(session_dir: str) -> List[Dict[str, Any]]:
+    """All page geometries of a session ([] for sessions created before pages.json existed)."""
+    path = os.path.join(session_dir, GEOMETRY_FILE)
+    if not os.path.exists(path):
+        return []
+    with open(path, "r", encoding="utf-8") as f:
+        return json.load(f).get("pages", [])
+
+def get_page_geometry(session_dir: str, page_index: int) -> Optional[Dict[str, Any]]:
+    for geom in load_geometry(session_dir):
+        if geom["index"] == page_index:
+            return geom
+    return None
+
+def pt_to_px(bbox: List[float], geom: Dict[str, Any]) -> List[float]:
+    x, y, w, h = bbox
+    sx, sy = geom["scale_x"], geom["scale_y"]
+    ox, oy = geom.get("origin_x", 0.0), geom.get("origin_y", 0.0)
+    return [(x - ox) * sx, (y - oy) * sy, w * sx, h * sy]
+
+def px_to_pt(bbox: List[float], geom: Dict[str, Any]) -> List[float]:
+    x, y, w, h = bbox
+    sx, sy = geom["scale_x"], geom["scale_y"]
+    ox, oy = geom.get("origin_x", 0.0), geom.get("origin_y", 0.0)
+    return [x / sx + ox, y / sy + oy, w / sx, h / sy]
+
+def preview_to_px(bbox: List[float], geom: Dict[str, Any], preview_width: float) -> List[float]:
+    s = geom["width_px"] / float(preview_width)
+    return [v * s for v in bbox]
+
+def px_to_preview(bbox: List[float], geom: Dict[str, Any], preview_width: float) -> List[float]:
+    s = float(preview_width) / geom["width_px"]
+    return [v * s for v in bbox]
+
+def to_px(bbox: List[float], geom: Optional[Dict[str, Any]], units: str = "px",
+          preview_width: Optional[float] = None) -> List[float]:
+    """Convert a bbox given in 'px', 'pt' or 'preview' units to raster pixels."""
+    if units == "px":
+        return list(bbox)
+    if geom is None:
+        raise ValueError(f"No page geometry recorded; cannot convert '{units}' coordinates.")
+    if units == "pt":
+        return pt_to_px(bbox, geom)
+    if units == "preview":
+        if not preview_width:
+            raise ValueError("preview_width is required for 'preview' coordinates.")
+        return preview_to_px(bbox, geom, preview_width)
+    raise ValueError(f"Unknown coordinate units: {units}")
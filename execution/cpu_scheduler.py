@@ -0,0 +1,162 @@
+"""
+CPU thread budgets for the heavy engines (OCR, inpainting).
+
+PaddleOCR, PyTorch (LaMa), OpenCV and the BLAS behind NumPy each default to one
+thread per core. Running OCR and inpainting at the same time then puts 2-3x the
+core count of busy threads on the CPU and throughput collapses. Instead the
+cores are split statically:
+
+- Every engine gets a fixed thread budget, applied when its model is created
+  (PaddleOCR cpu_threads, torch.set_num_threads). By default the budgets add up
+  to CPU_CORES, and each engine runs one job at a time (its model lock), so OCR
+  and inpainting can always run side by side without oversubscription and there
+  is nothing to admit or queue here. The cost: a lone OCR or LaMa job uses only
+  its share of the cores, not all of them (PaddleOCR cannot resize its pool
+  after the model is created). Set OCR_THREADS / INPAINT_THREADS to favour one.
+- Generic OpenMP / BLAS pools are capped through environment variables at import
+  time, so this module must be imported before numpy / torch / paddle.
+- OpenCV has a single process-wide pool (cv2.setNumThreads applies to every
+  thread, whichever engine calls cv2), so it cannot follow one engine's budget.
+  Its parallel regions run inside OCR / inpainting jobs, one at a time, so
+  configure_opencv() sizes it to the smallest engine budget: cv2 work then stays
+  within the cores of whichever job calls it.
+- slot(engine, lock) wraps each job: it takes the engine's model lock and records
+  wait / run times and busy cores for /metrics.
+
+Configuration (environment, or configure() in worker processes):
+    CPU_CORES          cores this process may use (default: os.cpu_count())
+    OCR_THREADS        threads per OCR job (default: half the cores)
+    INPAINT_THREADS    threads per inpainting job (default: the other half)
+"""
+import os
+import threading
+import time
+from typing import Any, Dict, Optional
+
+CPU_CORES = 1
+ENGINES: Dict[str, Dict[str, int]] = {}
+
+def configure(cpu_cores: Optional[int] = None, ocr_threads: Optional[int] = None,
+              inpaint_threads: Optional[int] = None):
+    """
+    Set the core count and per-engine budgets (arguments override the environment).
+    Takes effect for models created afterwards.
+    """
+    global CPU_CORES
+    CPU_CORES = max(1, int(cpu_cores or os.environ.get("CPU_CORES") or os.cpu_count() or 1))
+
+    def threads(value: Optional[int], var: str, default: int) -> int:
+        return max(1, min(CPU_CORES, int(value or os.environ.get(var) or default)))
+
+    ocr = threads(ocr_threads, "OCR_THREADS", max(1, CPU_CORES // 2))
+    ENGINES["ocr"] = {"threads": ocr}
+    ENGINES["inpaint"] = {"threads": threads(inpaint_threads, "INPAINT_THREADS", max(1, CPU_CORES - ocr))}
+
+configure()
+
+# Libraries that size their pools from the environment read it when they load
+for _var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS", "NUMEXPR_NUM_THREADS"):
+    os.environ.setdefault(_var, str(max(e["threads"] for e in ENGINES.values())))
+
+_lock = threading.Lock()
+_busy_cores = 0
+_started = time.monotonic()
+_busy_core_seconds = 0.0
+_last_change = _started
+_stats = {
+    name: {"running": 0, "queued": 0, "completed": 0, "wait_s": 0.0, "run_s": 0.0, "max_wait_s": 0.0, "max_queued": 0}
+    for name in ENGINES
+}
+
+def threads_for(engine: str) -> int:
+    """Thread budget of one job of this engine."""
+    return ENGINES[engine]["threads"]
+
+def configure_opencv():
+    """Size OpenCV's process-wide thread pool to the smallest engine budget (call once at startup)."""
+    try:
+        import cv2
+    except ImportError:
+        return
+    cv2.setNumThreads(min(e["threads"] for e in ENGINES.values()))
+
+def _account():
+    """Integrate busy cores over time (call with _lock held, before changing _busy_cores)."""
+    global _busy_core_seconds, _last_change
+    now = time.monotonic()
+    _busy_core_seconds += _busy_cores * (now - _last_change)
+    _last_change = now
+
+class slot:
+    """
+    Context manager around one engine job: takes the engine's model lock (if given)
+    and accounts the job's thread budget while it runs.
+
+        with cpu_scheduler.slot("ocr", _ocr_lock):
+            ...
+    """
+    def __init__(self, engine: str, lock: Optional[threading.Lock] = None):
+        self.engine = engine
+        self.lock = lock
+        self.threads = threads_for(engine)
+
+    def __enter__(self):
+        global _busy_cores
+        requested = time.monotonic()
+        stats = _stats[self.engine]
+        with _lock:
+            stats["queued"] += 1
+            stats["max_queued"] = max(stats["max_queued"], stats["queued"])
+        try:
+            if self.lock is not None:
+                self.lock.acquire()
+        finally:
+            with _lock:
+                stats["queued"] -= 1
+        with _lock:
+            _account()
+            _busy_cores += self.threads
+            stats["running"] += 1
+            self.start = time.monotonic()
+            wait = self.start - requested
+            stats["wait_s"] += wait
+            stats["max_wait_s"] = max(stats["max_wait_s"], wait)
+        return self
+
+    def __exit__(self, *exc):
+        global _busy_cores
+        with _lock:
+            _account()
+            _busy_cores -= self.threads
+            stats = _stats[self.engine]
+            stats["running"] -= 1
+            stats["completed"] += 1
+            stats["run_s"] += time.monotonic() - self.start
+        if self.lock is not None:
+            self.lock.release()
+
+def metrics() -> Dict[str, Any]:
+    """Budgets, current load, queue lengths and utilization since start."""
+    with _lock:
+        _account()
+        uptime = _last_change - _started
+        engines = {}
+        for name, stats in _stats.items():
+            done = stats["completed"]
+            engines[name] = dict(
+                ENGINES[name],
+                running=stats["running"],
+                queued=stats["queued"],
+                max_queued=stats["max_queued"],
+                completed=done,
+                avg_wait_ms=round(stats["wait_s"] / done * 1000, 1) if done else None,
+                max_wait_ms=round(stats["max_wait_s"] * 1000, 1),
+                avg_run_ms=round(stats["run_s"] / done * 1000, 1) if done else None,
+            )
+        return {
+            "cpu_cores": CPU_CORES,
+            "busy_cores": _busy_cores,
+            "utilization": round(_busy_core_seconds / (CPU_CORES * uptime), 4) if uptime > 0 else 0.0,
+            "uptime_s": round(uptime, 1),
+            "engines": engines,
+        }
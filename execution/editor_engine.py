@@ -1,10 +1,16 @@
+import hashlib
 import logging
 import os
 import shutil
 import threading
+import time
+from collections import OrderedDict
 from typing import Tuple, List, Optional, Union
 from PIL import Image, ImageDraw, ImageFont
 
+# Caps the OpenMP / BLAS pools, so it must come before torch (simple_lama) and cv2
+from execution import cpu_scheduler
+
 try:
     from simple_lama_inpainting import SimpleLama
 except ImportError:
@@ -13,11 +19,24 @@ except ImportError:
 import cv2
 import numpy as np
 
+from execution import font_registry
+
 logger = logging.getLogger(__name__)
 
 _lama_model = None
 _lama_lock = threading.Lock()
 
+# Inpainted patches keyed by a hash of the surrounding background, so the same element
+# repeated on many pages (footer, watermark) is inpainted once and pasted elsewhere.
+PATCH_CONTEXT = 16        # px of unmasked surroundings included in the hash
+PATCH_CACHE_MAX_BYTES = 256 * 1024 * 1024
+_patch_cache: "OrderedDict[str, Image.Image]" = OrderedDict()
+_patch_cache_bytes = 0
+_patch_cache_lock = threading.Lock()
+
+# Simulated LaMa latency (seconds) of the 'mock' inpaint method, e.g. for load tests
+MOCK_INPAINT_LATENCY = float(os.environ.get("MOCK_INPAINT_LATENCY", "0"))
+
 def apply_simple_fill(img: Image.Image, bbox: list, fill_color: Optional[str] = None) -> Image.Image:
     """
     Fills the bbox with a solid color.
@@ -148,13 +167,220 @@ def get_font_path(family: str, is_bold: bool, is_italic: bool) -> str:
     
     return os.path.join(FONTS_DIR, filename)
 
+def _patch_key(img: Image.Image, box: Tuple[int, int, int, int], method: str) -> str:
+    """Hash of the pixels around and under the masked box (plus its placement in that context)."""
+    x1, y1, x2, y2 = box
+    W, H = img.size
+    cx1, cy1 = max(0, x1 - PATCH_CONTEXT), max(0, y1 - PATCH_CONTEXT)
+    cx2, cy2 = min(W, x2 + PATCH_CONTEXT), min(H, y2 + PATCH_CONTEXT)
+    context = img.crop((cx1, cy1, cx2, cy2))
+    h = hashlib.sha1(context.tobytes())
+    h.update(f"{method}|{context.size}|{x1 - cx1},{y1 - cy1},{x2 - x1},{y2 - y1}".encode())
+    return h.hexdigest()
+
+def _cached_patch(key: str) -> Optional[Image.Image]:
+    with _patch_cache_lock:
+        patch = _patch_cache.get(key)
+        if patch is not None:
+            _patch_cache.move_to_end(key)
+        return patch
+
+def _store_patch(key: str, patch: Image.Image):
+    global _patch_cache_bytes
+    with _patch_cache_lock:
+        if key in _patch_cache:
+            return
+        _patch_cache[key] = patch
+        _patch_cache_bytes += patch.width * patch.height * 3
+        while _patch_cache_bytes > PATCH_CACHE_MAX_BYTES and len(_patch_cache) > 1:
+            _, old = _patch_cache.popitem(last=False)
+            _patch_cache_bytes -= old.width * old.height * 3
+
+def get_fill_bbox(bbox: list, fill_size: Optional[Union[str, float, int]] = "100%") -> List[int]:
+    """The area to inpaint/fill: bbox scaled by fill_size (e.g. "120%") around its center."""
+    # Calculate Fill Scale Factor
+    fill_scale = 1.0
+    if fill_size is not None:
+        try:
+            if isinstance(fill_size, str) and fill_size.strip().endswith("%"):
+                fill_scale = float(fill_size.strip().rstrip("%")) / 100.0
+            elif isinstance(fill_size, (int, float)):
+                fill_scale = float(fill_size) / 100.0
+        except ValueError:
+            logger.warning(f"Invalid fill_size: {fill_size}, defaulting to 100%")
+
+    # Calculate Expanded BBox for Inpainting/Filling
+    # Center remains the same, W and H grow
+    x, y, w, h = [int(v) for v in bbox]
+    cx, cy = x + w / 2, y + h / 2
+    
+    fill_w = int(w * fill_scale)
+    fill_h = int(h * fill_scale)
+    fill_x = int(cx - fill_w / 2)
+    fill_y = int(cy - fill_h / 2)
+    
+    return [fill_x, fill_y, fill_w, fill_h]
+
+LAMA_PAD = 5 # Pad is applied ON TOP of the expanded bbox for LaMa to be safe
+
+def _lama_patch_box(expanded_bbox: List[int], size: Tuple[int, int]) -> Tuple[int, int, int, int]:
+    """Masked area (expanded bbox + LAMA_PAD) as a crop box clipped to the image."""
+    fill_x, fill_y, fill_w, fill_h = expanded_bbox
+    W, H = size
+    return (max(0, fill_x - LAMA_PAD), max(0, fill_y - LAMA_PAD),
+            min(W, fill_x + fill_w + LAMA_PAD + 1), min(H, fill_y + fill_h + LAMA_PAD + 1))
+
+def _lama_patch(img: Image.Image, expanded_bbox: List[int], inpaint_method: str = "lama",
+                background: bool = False) -> Optional[Tuple[Image.Image, Tuple[int, int, int, int]]]:
+    """
+    (patch, patch_box) inpainting expanded_bbox (+pad) of img with LaMa, reusing a cached patch
+    when the background is identical. img is not modified.
+    background=True (pre-inpainting) gives up and returns None if an interactive edit is waiting.
+    """
+    fill_x, fill_y, fill_w, fill_h = expanded_bbox
+    pad = LAMA_PAD
+
+    patch_box = _lama_patch_box(expanded_bbox, img.size)
+    key = _patch_key(img, patch_box, inpaint_method)
+
+    patch = _cached_patch(key)
+    if patch is None:
+        model = get_lama_model()
+        with cpu_scheduler.slot("inpaint", _lama_lock):
+            # Another page may have inpainted the same background while we waited
+            patch = _cached_patch(key)
+            if patch is None:
+                if background and is_busy():
+                    return None
+                logger.info(f"Inpainting region {expanded_bbox} with LaMa...")
+                # Draw mask with padding on expanded area
+                mask = Image.new("L", img.size, 0)
+                ImageDraw.Draw(mask).rectangle([fill_x - pad, fill_y - pad, fill_x + fill_w + pad, fill_y + fill_h + pad], fill=255)
+                result = model(img, mask)
+                patch = result.crop(patch_box)
+                _store_patch(key, patch)
+    else:
+        logger.info(f"Reusing inpainted patch for {expanded_bbox} (identical background)")
+    return patch, patch_box
+
+def _lama_inpaint(img: Image.Image, expanded_bbox: List[int], inpaint_method: str = "lama") -> Image.Image:
+    """Inpaint expanded_bbox (+pad) of img in place with LaMa (see _lama_patch)."""
+    patch, patch_box = _lama_patch(img, expanded_bbox, inpaint_method)
+    # LaMa only changes the masked area; paste it back so the page keeps its exact size
+    img.paste(patch, patch_box[:2])
+    return img
+
+# --- Interactive priority ---
+# Interactive edits announce themselves so that background pre-inpainting (precompute_patch)
+# yields the LaMa model to them between blocks.
+_interactive_count = 0
+_interactive_cond = threading.Condition()
+
+class _interactive:
+    def __enter__(self):
+        global _interactive_count
+        with _interactive_cond:
+            _interactive_count += 1
+
+    def __exit__(self, *exc):
+        global _interactive_count
+        with _interactive_cond:
+            _interactive_count -= 1
+            _interactive_cond.notify_all()
+
+def wait_until_idle(timeout: Optional[float] = None) -> bool:
+    """Block until no interactive edit is running. Returns False on timeout."""
+    with _interactive_cond:
+        return _interactive_cond.wait_for(lambda: _interactive_count == 0, timeout=timeout)
+
+def is_busy() -> bool:
+    return _interactive_count > 0
+
+def load_inpaint_source(image_path: str) -> Optional[Image.Image]:
+    """Decoded original of the page (what apply_edit inpaints), or None if missing."""
+    original_path = image_path + ".original"
+    source = original_path if os.path.exists(original_path) else image_path
+    if not os.path.exists(source):
+        return None
+    with Image.open(source) as img:
+        return img.convert("RGB")
+
+def precompute_patch(image_path: str, bbox: list, fill_size: Optional[Union[str, float, int]] = "100%",
+                     img: Optional[Image.Image] = None) -> bool:
+    """
+    Low-priority: inpaint bbox of the page's original image with LaMa and keep only the
+    cached patch, so a later apply_edit of that block (default settings) is a cache hit.
+    Pass img (load_inpaint_source) to reuse one decode for all blocks of a page; it is
+    only read, so every block is keyed and inpainted against the untouched original.
+    Gives way to interactive edits; returns False if skipped (busy, cached or no original).
+    """
+    if is_busy():
+        return False
+    if img is None:
+        img = load_inpaint_source(image_path)
+        if img is None:
+            return False
+
+    expanded_bbox = get_fill_bbox(bbox, fill_size)
+    if _cached_patch(_patch_key(img, _lama_patch_box(expanded_bbox, img.size), "lama")) is not None:
+        return False
+
+    return _lama_patch(img, expanded_bbox, "lama", background=True) is not None
+
+def get_fallback_fonts(is_bold: bool, is_italic: bool) -> List[str]:
+    """
+    Font filenames to try for characters the chosen font lacks: the same style of every
+    FONT_MAP family (default family first), then any other face. Only faces installed in
+    static/fonts (indexed by the registry) are returned.
+    """
+    installed = font_registry.available_faces()
+    families = [DEFAULT_FONT_FAMILY] + [f for f in FONT_MAP if f != DEFAULT_FONT_FAMILY]
+    names = [os.path.basename(get_font_path(f, is_bold, is_italic)) for f in families]
+    return [name for name in dict.fromkeys(names + installed) if name in installed]
+
+def get_font_runs(text: str, font_family: str, is_bold: bool, is_italic: bool) -> List[Tuple[str, str]]:
+    """
+    Split text into (font_path, substring) runs so every character uses a font that has
+    a glyph for it (e.g. CJK inside Latin text). Uses the precomputed font registry.
+    If the chosen font is not installed, the first installed fallback takes its place.
+    """
+    primary = os.path.basename(get_font_path(font_family, is_bold, is_italic))
+    fallbacks = get_fallback_fonts(is_bold, is_italic)
+    if primary not in font_registry.available_faces() and fallbacks:
+        primary = fallbacks[0]
+    runs = font_registry.split_runs(text, primary, fallbacks)
+    return [(os.path.join(FONTS_DIR, name), part) for name, part in runs]
+
+def fit_font_size(runs: List[Tuple[str, str]], width: int, height: int) -> int:
+    """
+    Same fitting rule as get_optimal_font_scale (80% of height, shrink to fit width),
+    computed from precomputed advance widths instead of trial rendering.
+    """
+    min_size = 10
+    size = max(int(height * 0.8), min_size)
+    text_em = sum(font_registry.text_advance(os.path.basename(path), part) for path, part in runs)
+    if text_em * size > width and text_em > 0:
+        size = max(int(width / text_em * 0.95), min_size)
+    return size
+
+def _set_torch_threads(n: int):
+    try:
+        import torch
+        torch.set_num_threads(n)
+    except ImportError:
+        pass
+
 def get_lama_model():
     global _lama_model
     if _lama_model is None:
         if SimpleLama is None:
             raise ImportError("simple-lama-inpainting not installed")
-        logger.info("Loading LaMa model...")
-        _lama_model = SimpleLama()
+        # Pages may be rebuilt concurrently; load the model only once
+        with _lama_lock:
+            if _lama_model is None:
+                logger.info("Loading LaMa model...")
+                _set_torch_threads(cpu_scheduler.threads_for("inpaint"))
+                _lama_model = SimpleLama()
     return _lama_model
 
 def get_optimal_font_scale(text: str, width: int, height: int, font_path: str) -> Tuple[ImageFont.FreeTypeFont, int]:
@@ -213,7 +439,7 @@ def apply_edit(image_path: str, bbox: list, text: str,
         shutil.copy2(image_path, original_path)
     
     if restore_first:
-        shutil.copy2(original_path, image_path)
+        shutil.copyfile(original_path, image_path)  # new mtime: the page changed
     
     # 2. Load Image
     img = Image.open(image_path).convert("RGB")
@@ -222,33 +448,9 @@ def apply_edit(image_path: str, bbox: list, text: str,
     # Only inpaint if we have text to write or if we explicitly want to clear the area
     # Even if empty text, we probably want to clear the old text (inpaint).
     
-    # Calculate Fill Scale Factor
-    fill_scale = 1.0
-    if fill_size is not None:
-        try:
-            if isinstance(fill_size, str) and fill_size.strip().endswith("%"):
-                fill_scale = float(fill_size.strip().rstrip("%")) / 100.0
-            elif isinstance(fill_size, (int, float)):
-                fill_scale = float(fill_size) / 100.0
-        except ValueError:
-            logger.warning(f"Invalid fill_size: {fill_size}, defaulting to 100%")
-
-    # Calculate Expanded BBox for Inpainting/Filling
-    # Center remains the same, W and H grow
+    expanded_bbox = get_fill_bbox(bbox, fill_size)
     x, y, w, h = [int(v) for v in bbox]
-    cx, cy = x + w / 2, y + h / 2
-    
-    fill_w = int(w * fill_scale)
-    fill_h = int(h * fill_scale)
-    fill_x = int(cx - fill_w / 2)
-    fill_y = int(cy - fill_h / 2)
-    
-    expanded_bbox = [fill_x, fill_y, fill_w, fill_h]
 
-    mask = Image.new("L", img.size, 0)
-    draw_mask = ImageDraw.Draw(mask)
-    
-    pad = 5 # Pad is applied ON TOP of the expanded bbox for LaMa to be safe
     # If using simple fill, we use expanded_bbox exactly
     if inpaint_method == "simple_filled":
         # Pass [x, y, w, h] format to simple_fill? 
@@ -256,15 +458,16 @@ def apply_edit(image_path: str, bbox: list, text: str,
         # It currently takes 'bbox' which is [x,y,w,h]
         # So we pass expanded_bbox (x,y,w,h)
         img = apply_simple_fill(img, expanded_bbox, fill_color)
+    elif inpaint_method == "mock":
+        # Deterministic LaMa stand-in: border-colour fill, serialized like LaMa, with simulated latency
+        with cpu_scheduler.slot("inpaint", _lama_lock):
+            if MOCK_INPAINT_LATENCY > 0:
+                time.sleep(MOCK_INPAINT_LATENCY)
+            img = apply_simple_fill(img, expanded_bbox)
     else:
         # LaMa
-        # Draw mask with padding on expanded area
-        draw_mask.rectangle([fill_x - pad, fill_y - pad, fill_x + fill_w + pad, fill_y + fill_h + pad], fill=255)
-        
-        model = get_lama_model()
-        logger.info(f"Inpainting region {expanded_bbox} (Orig: {bbox}) with LaMa...")
-        with _lama_lock:
-            img = model(img, mask) 
+        with _interactive():
+            img = _lama_inpaint(img, expanded_bbox, inpaint_method)
 
     # 4. Draw Text
     draw = ImageDraw.Draw(img)
@@ -301,19 +504,45 @@ def apply_edit(image_path: str, bbox: list, text: str,
     scaled_w = int(w * final_scale_factor)
     scaled_h = int(h * final_scale_factor)
     
-    # Use the optimized font scale logic with SCALED dimensions
-    font, final_size = get_optimal_font_scale(text, scaled_w, scaled_h, font_path)
-    
-    text_bbox = font.getbbox(text)
-    text_w = text_bbox[2] - text_bbox[0]
-    text_h = text_bbox[3] - text_bbox[1]
-    
-    text_x = x + (w - text_w) / 2 + offset_x
-    text_y = y + (h - text_h) / 2 - text_bbox[1] + offset_y
-    
-    logger.info(f"Drawing: '{text}' | Fam: {font_family} | Size{final_size} | Color:{text_color} | B:{is_bold} I:{is_italic}")
-    
-    draw.text((text_x, text_y), text, font=font, fill=text_color)
+    try:
+        runs = get_font_runs(text, font_family, is_bold, is_italic) if text else []
+    except Exception as e:
+        logger.warning(f"Font registry unavailable ({e}), using {font_path} only")
+        runs = None
+
+    if runs is None or (len(runs) == 1 and runs[0][0] == font_path):
+        # Use the optimized font scale logic with SCALED dimensions
+        font, final_size = get_optimal_font_scale(text, scaled_w, scaled_h, font_path)
+        
+        text_bbox = font.getbbox(text)
+        text_w = text_bbox[2] - text_bbox[0]
+        text_h = text_bbox[3] - text_bbox[1]
+        
+        text_x = x + (w - text_w) / 2 + offset_x
+        text_y = y + (h - text_h) / 2 - text_bbox[1] + offset_y
+        
+        logger.info(f"Drawing: '{text}' | Fam: {font_family} | Size{final_size} | Color:{text_color} | B:{is_bold} I:{is_italic}")
+        
+        draw.text((text_x, text_y), text, font=font, fill=text_color)
+    elif runs:
+        # Fallback fonts needed: size from precomputed advances, draw run by run on a shared baseline
+        final_size = fit_font_size(runs, scaled_w, scaled_h)
+        fonts = [ImageFont.truetype(path, final_size) for path, _ in runs]
+
+        run_widths = [f.getlength(part) for f, (_, part) in zip(fonts, runs)]
+        # Centre the glyph bbox of all runs (relative to the baseline), like the single-font path
+        run_bboxes = [f.getbbox(part, anchor="ls") for f, (_, part) in zip(fonts, runs)]
+        top = min(b[1] for b in run_bboxes)
+        bottom = max(b[3] for b in run_bboxes)
+
+        text_x = x + (w - sum(run_widths)) / 2 + offset_x
+        baseline_y = y + (h - (bottom - top)) / 2 - top + offset_y
+
+        logger.info(f"Drawing: '{text}' | Fam: {font_family} + fallbacks {[os.path.basename(p) for p, _ in runs]} | Size{final_size} | Color:{text_color} | B:{is_bold} I:{is_italic}")
+
+        for f, (_, part), run_w in zip(fonts, runs, run_widths):
+            draw.text((text_x, baseline_y), part, font=f, fill=text_color, anchor="ls")
+            text_x += run_w
     
     # 5. Save
     img.save(image_path)
@@ -322,7 +551,7 @@ def apply_edit(image_path: str, bbox: list, text: str,
 def restore_page(image_path: str):
     original_path = image_path + ".original"
     if os.path.exists(original_path):
-        shutil.copy2(original_path, image_path)
+        shutil.copyfile(original_path, image_path)  # new mtime: the page changed
     else:
         logger.warning(f"No backup found.")
 
@@ -336,7 +565,7 @@ def restore_page(image_path: str):
     """
     original_path = image_path + ".original"
     if os.path.exists(original_path):
-        shutil.copy2(original_path, image_path)
+        shutil.copyfile(original_path, image_path)  # new mtime: the page changed
         logger.info(f"Restored {image_path} from backup")
     else:
         logger.warning(f"No backup found for {image_path}, cannot restore.")
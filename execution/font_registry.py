@@ -0,0 +1,289 @@
+"""
+Font registry: glyph coverage and advance widths for every face in static/fonts.
+
+The cmap / hmtx tables of each font are parsed once into a compact binary index
+(.cache/fonts/fonts.bin + fonts.json). Processes memory-map the index, so coverage
+checks, fallback selection and text width estimates are table lookups shared through
+the OS page cache instead of per-process font loading and trial rendering.
+
+Index layout per face (native byte order):
+    codepoints: uint32[count], sorted
+    advances:   uint16[count], advance width (font units) of the glyph for each codepoint
+"""
+import bisect
+import json
+import logging
+import mmap
+import os
+import struct
+import threading
+from array import array
+from typing import Dict, List, Optional, Tuple
+
+logger = logging.getLogger(__name__)
+
+ROOT_DIR = os.path.dirname(os.path.dirname(__file__))
+FONTS_DIR = os.path.join(ROOT_DIR, "static", "fonts")
+INDEX_DIR = os.path.join(ROOT_DIR, ".cache", "fonts")
+
+INDEX_VERSION = 1
+FONT_EXTENSIONS = (".ttf", ".otf")
+
+_faces: Dict[str, Dict] = {}
+_mmap = None
+_registry_lock = threading.Lock()
+
+# --- Font parsing ---
+
+def _read_tables(data: bytes) -> Dict[str, Tuple[int, int]]:
+    """Table tag -> (offset, length). For collections (.ttc) the first face is used."""
+    base = 0
+    if data[:4] == b"ttcf":
+        base = struct.unpack(">I", data[12:16])[0]
+    num_tables = struct.unpack(">H", data[base + 4:base + 6])[0]
+    tables = {}
+    for i in range(num_tables):
+        rec = base + 12 + 16 * i
+        tag, _, offset, length = struct.unpack(">4sIII", data[rec:rec + 16])
+        tables[tag.decode("latin-1")] = (offset, length)
+    return tables
+
+def _parse_cmap(data: bytes, offset: int) -> Dict[int, int]:
+    """Unicode codepoint -> glyph id, from the best Unicode cmap subtable (format 12 or 4)."""
+    num_subtables = struct.unpack(">H", data[offset + 2:offset + 4])[0]
+    subtables = {}
+    for i in range(num_subtables):
+        platform, encoding, sub_offset = struct.unpack(">HHI", data[offset + 4 + 8 * i:offset + 12 + 8 * i])
+        subtables[(platform, encoding)] = offset + sub_offset
+
+    # Prefer full-repertoire (format 12) subtables, then BMP ones
+    for key in [(3, 10), (0, 6), (0, 4), (3, 1), (0, 3), (0, 2), (0, 1), (0, 0)]:
+        if key not in subtables:
+            continue
+        sub = subtables[key]
+        fmt = struct.unpack(">H", data[sub:sub + 2])[0]
+        if fmt == 12:
+            return _parse_cmap12(data, sub)
+        if fmt == 4:
+            return _parse_cmap4(data, sub)
+    return {}
+
+def _parse_cmap4(data: bytes, sub: int) -> Dict[int, int]:
+    seg_count = struct.unpack(">H", data[sub + 6:sub + 8])[0] // 2
+    ends_at = sub + 14
+    starts_at = ends_at + 2 * seg_count + 2
+    deltas_at = starts_at + 2 * seg_count
+    range_offsets_at = deltas_at + 2 * seg_count
+
+    ends = struct.unpack(f">{seg_count}H", data[ends_at:ends_at + 2 * seg_count])
+    starts = struct.unpack(f">{seg_count}H", data[starts_at:starts_at + 2 * seg_count])
+    deltas = struct.unpack(f">{seg_count}h", data[deltas_at:deltas_at + 2 * seg_count])
+    range_offsets = struct.unpack(f">{seg_count}H", data[range_offsets_at:range_offsets_at + 2 * seg_count])
+
+    mapping = {}
+    for seg in range(seg_count):
+        start, end, delta, range_offset = starts[seg], ends[seg], deltas[seg], range_offsets[seg]
+        if start == 0xFFFF:
+            continue
+        for c in range(start, end + 1):
+            if range_offset == 0:
+                gid = (c + delta) & 0xFFFF
+            else:
+                addr = range_offsets_at + 2 * seg + range_offset + 2 * (c - start)
+                gid = struct.unpack(">H", data[addr:addr + 2])[0]
+                if gid:
+                    gid = (gid + delta) & 0xFFFF
+            if gid:
+                mapping[c] = gid
+    return mapping
+
+def _parse_cmap12(data: bytes, sub: int) -> Dict[int, int]:
+    num_groups = struct.unpack(">I", data[sub + 12:sub + 16])[0]
+    mapping = {}
+    for i in range(num_groups):
+        start, end, start_gid = struct.unpack(">III", data[sub + 16 + 12 * i:sub + 28 + 12 * i])
+        for c in range(start, end + 1):
+            mapping[c] = start_gid + (c - start)
+    return mapping
+
+def parse_font(path: str) -> Dict:
+    """Read units_per_em and (codepoint, advance) pairs of a font file."""
+    with open(path, "rb") as f:
+        data = f.read()
+    tables = _read_tables(data)
+
+    head = tables["head"][0]
+    units_per_em = struct.unpack(">H", data[head + 18:head + 20])[0]
+
+    hhea = tables["hhea"][0]
+    num_hmetrics = struct.unpack(">H", data[hhea + 34:hhea + 36])[0]
+
+    hmtx = tables["hmtx"][0]
+    hmetrics = struct.unpack(f">{2 * num_hmetrics}H", data[hmtx:hmtx + 4 * num_hmetrics])
+    advance_by_gid = hmetrics[0::2]
+
+    cmap = _parse_cmap(data, tables["cmap"][0])
+    codepoints = sorted(cmap)
+    last = num_hmetrics - 1
+    advances = [advance_by_gid[min(cmap[c], last)] for c in codepoints]
+
+    return {
+        "units_per_em": units_per_em,
+        "codepoints": codepoints,
+        "advances": advances,
+    }
+
+# --- Index build / load ---
+
+def _font_files(fonts_dir: str) -> List[str]:
+    if not os.path.isdir(fonts_dir):
+        return []
+    return sorted(f for f in os.listdir(fonts_dir) if f.lower().endswith(FONT_EXTENSIONS))
+
+def _file_stamp(path: str) -> List[int]:
+    st = os.stat(path)
+    return [st.st_size, int(st.st_mtime)]
+
+def _index_is_current(fonts_dir: str, index_dir: str) -> bool:
+    meta_path = os.path.join(index_dir, "fonts.json")
+    if not os.path.exists(meta_path) or not os.path.exists(os.path.join(index_dir, "fonts.bin")):
+        return False
+    with open(meta_path, "r", encoding="utf-8") as f:
+        meta = json.load(f)
+    if meta.get("version") != INDEX_VERSION:
+        return False
+    files = _font_files(fonts_dir)
+    if sorted(meta["faces"]) != files:
+        return False
+    return all(meta["faces"][name]["stamp"] == _file_stamp(os.path.join(fonts_dir, name)) for name in files)
+
+def build_index(fonts_dir: str = FONTS_DIR, index_dir: str = INDEX_DIR, force: bool = False) -> bool:
+    """
+    (Re)build the on-disk index if any font was added, removed or changed.
+    Returns True if the index was rebuilt.
+    """
+    if not force and _index_is_current(fonts_dir, index_dir):
+        return False
+
+    os.makedirs(index_dir, exist_ok=True)
+    faces = {}
+    blob = bytearray()
+    for name in _font_files(fonts_dir):
+        path = os.path.join(fonts_dir, name)
+        try:
+            font = parse_font(path)
+        except Exception as e:
+            logger.warning(f"Skipping font {name}: {e}")
+            continue
+
+        codepoints = array("I", font["codepoints"])
+        advances = array("H", font["advances"])
+        cp_offset = len(blob)
+        blob += codepoints.tobytes()
+        adv_offset = len(blob)
+        blob += advances.tobytes()
+        blob += b"\0" * (-len(blob) % 4)  # keep the next uint32 array aligned
+
+        faces[name] = {
+            "stamp": _file_stamp(path),
+            "units_per_em": font["units_per_em"],
+            "count": len(codepoints),
+            "cp_offset": cp_offset,
+            "adv_offset": adv_offset,
+        }
+
+    # Write data first, then metadata; both via rename so readers never see a partial index
+    bin_path = os.path.join(index_dir, "fonts.bin")
+    with open(bin_path + ".tmp", "wb") as f:
+        f.write(bytes(blob) or b"\0")
+    os.replace(bin_path + ".tmp", bin_path)
+
+    meta_path = os.path.join(index_dir, "fonts.json")
+    with open(meta_path + ".tmp", "w", encoding="utf-8") as f:
+        json.dump({"version": INDEX_VERSION, "faces": faces}, f)
+    os.replace(meta_path + ".tmp", meta_path)
+
+    logger.info(f"Built font index for {len(faces)} faces ({len(blob) // 1024} KB)")
+    return True
+
+def load_registry(fonts_dir: str = FONTS_DIR, index_dir: str = INDEX_DIR):
+    """Build the index if needed and memory-map it. Safe to call repeatedly."""
+    global _faces, _mmap
+    with _registry_lock:
+        if _mmap is not None:
+            return
+        build_index(fonts_dir, index_dir)
+
+        with open(os.path.join(index_dir, "fonts.json"), "r", encoding="utf-8") as f:
+            meta = json.load(f)
+        with open(os.path.join(index_dir, "fonts.bin"), "rb") as f:
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+
+        view = memoryview(mm)
+        faces = {}
+        for name, face in meta["faces"].items():
+            count = face["count"]
+            faces[name] = dict(
+                face,
+                codepoints=view[face["cp_offset"]:face["cp_offset"] + 4 * count].cast("I"),
+                advances=view[face["adv_offset"]:face["adv_offset"] + 2 * count].cast("H"),
+            )
+        _faces, _mmap = faces, mm
+
+def _face(filename: str) -> Optional[Dict]:
+    if _mmap is None:
+        load_registry()
+    return _faces.get(filename)
+
+# --- Lookups ---
+
+def available_faces() -> List[str]:
+    if _mmap is None:
+        load_registry()
+    return sorted(_faces)
+
+def _lookup(face: Dict, ch: str) -> int:
+    """Index of ch in the face's tables, or -1 if not covered."""
+    cp = ord(ch)
+    codepoints = face["codepoints"]
+    i = bisect.bisect_left(codepoints, cp)
+    return i if i < len(codepoints) and codepoints[i] == cp else -1
+
+def covers(filename: str, ch: str) -> bool:
+    """True if the face has a glyph for ch. Control characters count as covered."""
+    if ord(ch) < 0x20:
+        return True
+    face = _face(filename)
+    return face is not None and _lookup(face, ch) >= 0
+
+def text_advance(filename: str, text: str) -> float:
+    """Advance width of text in em units (multiply by the font size in px for pixels)."""
+    face = _face(filename)
+    if face is None:
+        return 0.0
+    total = 0
+    for ch in text:
+        i = _lookup(face, ch)
+        if i >= 0:
+            total += face["advances"][i]
+    return total / float(face["units_per_em"])
+
+def split_runs(text: str, primary: str, fallbacks: List[str]) -> List[Tuple[str, str]]:
+    """
+    Split text into (font filename, substring) runs. Each character uses the primary
+    face if it covers it, otherwise the first fallback that does (else the primary,
+    which will render tofu). Adjacent characters with the same face are merged.
+    """
+    candidates = [primary] + [f for f in fallbacks if f != primary]
+    runs: List[Tuple[str, str]] = []
+    for ch in text:
+        face = primary
+        if not covers(primary, ch) and not ch.isspace():
+            face = next((f for f in candidates if covers(f, ch)), primary)
+        elif ch.isspace() and runs:
+            face = runs[-1][0]  # keep spaces in the surrounding run
+        if runs and runs[-1][0] == face:
+            runs[-1] = (face, runs[-1][1] + ch)
+        else:
+            runs.append((face, ch))
+    return runs
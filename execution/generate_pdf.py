@@ -1,27 +1,254 @@
 import os
 import glob
 import re
-from PIL import Image
+import shutil
+import filecmp
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, Dict, List, Optional
+from PIL import Image, ImageChops, ImageFilter
+
+from execution import coords, block_store, page_versions
 
 def natural_sort_key(s):
     """Sort strings containing numbers naturally."""
     return [int(text) if text.isdigit() else text.lower()
             for text in re.split('([0-9]+)', s)]
 
-def create_pdf(session_dir: str, modifications: list) -> str:
+ENCODED_DIR = ".encoded"
+
+# Resolution used when a session has no recorded page geometry
+DEFAULT_RESOLUTION = 100.0
+
+def _encode_page(image_path: str, encoded_path: str, resolution: float = DEFAULT_RESOLUTION):
+    """Encode one page image as a single-page PDF (temp file + rename, so it is never half-written)."""
+    img = Image.open(image_path)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    tmp_path = encoded_path + ".tmp"
+    img.save(tmp_path, "PDF", resolution=resolution)
+    os.replace(tmp_path, encoded_path)
+
+def _encoding_key(sources: List[str], resolution: float) -> str:
+    """
+    Content hashes of the files an encoding was made from (plus its resolution).
+    Content, not mtime: restore_page copies back an older file, which must still
+    invalidate the encoding of the edited page.
+    """
+    versions = [page_versions.page_version(p) if os.path.exists(p) else "-" for p in sources]
+    return " ".join(versions + [str(resolution)])
+
+def _read_key(encoded_path: str) -> Optional[str]:
+    try:
+        with open(encoded_path + ".key", "r", encoding="utf-8") as f:
+            return f.read().strip()
+    except OSError:
+        return None
+
+def _write_key(encoded_path: str, key: str):
+    with open(encoded_path + ".key.tmp", "w", encoding="utf-8") as f:
+        f.write(key)
+    os.replace(encoded_path + ".key.tmp", encoded_path + ".key")
+
+def _copy_source_page(input_pdf: str, page_index: int, encoded_path: str):
+    """Copy one page of the uploaded PDF into a single-page PDF (no re-encoding)."""
+    import fitz  # PyMuPDF
+
+    with fitz.open(input_pdf) as src:
+        doc = fitz.open()
+        doc.insert_pdf(src, from_page=page_index, to_page=page_index)
+        tmp_path = encoded_path + ".tmp"
+        doc.save(tmp_path, garbage=3)
+        doc.close()
+    os.replace(tmp_path, encoded_path)
+
+# --- Mixed raster content (compression="mrc") ---
+# Each page becomes three layers:
+#   background: the page with text removed, downsampled by MRC_BG_SCALE, JPEG
+#   mask:       1-bit text mask at full resolution, Flate (lossless), used as a stencil
+#   foreground: text colours, downsampled by MRC_FG_SCALE, JPEG, painted through the mask
+# Text stays sharp (mask edges are full resolution) while the large, smooth areas are
+# stored at a fraction of the pixels.
+MRC_BG_SCALE = 3
+MRC_BG_QUALITY = 50
+MRC_FG_SCALE = 4
+MRC_FG_QUALITY = 75
+MRC_THRESHOLD = 60     # min colour distance (0-255, any channel) from the local background
+MRC_TEXT_PAD = 4       # px around OCR blocks and edited pixels searched for text
+MRC_LOCAL_BG = 32      # cell size (px) of the local background estimate
+
+ENCODE_WORKERS = min(4, os.cpu_count() or 1)
+
+def _cell_mean(arr, weights, cell: int):
+    """Weighted mean of arr (H, W, C) over cell x cell blocks, and the per-cell weight sum."""
+    import numpy as np
+
+    H, W = arr.shape[:2]
+    h, w = -(-H // cell), -(-W // cell)
+    padded = np.zeros((h * cell, w * cell, arr.shape[2]), dtype=np.float32)
+    padded[:H, :W] = arr * weights[..., None]
+    wpad = np.zeros((h * cell, w * cell), dtype=np.float32)
+    wpad[:H, :W] = weights
+    sums = padded.reshape(h, cell, w, cell, -1).sum(axis=(1, 3))
+    counts = wpad.reshape(h, cell, w, cell).sum(axis=(1, 3))
+    mean = sums / np.maximum(counts, 1e-6)[..., None]
+    return mean, counts
+
+def _fill_empty_cells(mean, counts, passes: int = 2):
+    """Give cells without samples the colour of a neighbour (then the global mean) to limit JPEG/upsampling bleed."""
+    import numpy as np
+
+    filled = counts > 0
+    if not filled.any():
+        return mean
+    for _ in range(passes):
+        if filled.all():
+            break
+        grown, grown_mask = mean.copy(), filled.copy()
+        for dy, dx in ((0, 1), (0, -1), (1, 0), (-1, 0)):
+            shifted = np.roll(np.roll(mean, dy, axis=0), dx, axis=1)
+            shifted_ok = np.roll(np.roll(filled, dy, axis=0), dx, axis=1)
+            take = ~grown_mask & shifted_ok
+            grown[take] = shifted[take]
+            grown_mask |= take
+        mean, filled = grown, grown_mask
+    mean[~filled] = mean[filled].mean(axis=0)
+    return mean
+
+def _jpeg_bytes(arr, quality: int) -> bytes:
+    import io
+    import numpy as np
+
+    buf = io.BytesIO()
+    Image.fromarray(np.clip(arr, 0, 255).astype("uint8"), "RGB").save(buf, "JPEG", quality=quality, optimize=True)
+    return buf.getvalue()
+
+def _edited_region(image_path: str, original_path: str):
+    """Boolean (H, W) mask of pixels an edit changed (vs. the '.original' backup), grown by MRC_TEXT_PAD."""
+    import numpy as np
+
+    with Image.open(image_path) as edited, Image.open(original_path) as original:
+        if edited.size != original.size:
+            return None
+        diff = ImageChops.difference(edited.convert("RGB"), original.convert("RGB")).convert("L")
+    changed = diff.point(lambda v: 255 if v else 0)
+    if MRC_TEXT_PAD:
+        changed = changed.filter(ImageFilter.MaxFilter(2 * MRC_TEXT_PAD + 1))
+    return np.asarray(changed) > 0
+
+def _mrc_layers(image_path: str, text_boxes: Optional[List[List[float]]]) -> Dict[str, Any]:
+    """
+    Split a page image into MRC layers. text_boxes ([x, y, w, h] px, e.g. OCR blocks) limit
+    where text is looked for; None searches the whole page. On edited pages the changed
+    pixels are searched too, since edited text may be drawn outside the OCR box (offsets,
+    larger font sizes).
+    Pure numpy / PIL, so pages can be processed on worker threads.
+    """
+    import numpy as np
+
+    with Image.open(image_path) as img:
+        rgb = np.asarray(img.convert("RGB"), dtype=np.float32)
+    H, W = rgb.shape[:2]
+
+    # Local background: mean colour of each MRC_LOCAL_BG cell, upsampled back
+    ones = np.ones((H, W), dtype=np.float32)
+    local, _ = _cell_mean(rgb, ones, MRC_LOCAL_BG)
+    local_bg = np.repeat(np.repeat(local, MRC_LOCAL_BG, axis=0), MRC_LOCAL_BG, axis=1)[:H, :W]
+
+    # Text = pixels far from the local background, inside the text regions
+    mask = np.abs(rgb - local_bg).max(axis=2) > MRC_THRESHOLD
+    if text_boxes is not None:
+        region = np.zeros((H, W), dtype=bool)
+        for x, y, w, h in text_boxes:
+            x0, y0 = max(0, int(x) - MRC_TEXT_PAD), max(0, int(y) - MRC_TEXT_PAD)
+            x1, y1 = min(W, int(x + w) + MRC_TEXT_PAD + 1), min(H, int(y + h) + MRC_TEXT_PAD + 1)
+            region[y0:y1, x0:x1] = True
+        original_path = image_path + ".original"
+        if os.path.exists(original_path):
+            edited = _edited_region(image_path, original_path)
+            if edited is None:  # not comparable: search the whole page
+                region[:] = True
+            else:
+                region |= edited
+        mask &= region
+
+    # Background: text pixels replaced by the mean of the non-text pixels around them
+    bg_weights = (~mask).astype(np.float32)
+    bg_mean, bg_counts = _cell_mean(rgb, bg_weights, MRC_BG_SCALE)
+    bg_mean = _fill_empty_cells(bg_mean, bg_counts)
+
+    # Foreground: mean text colour per cell
+    fg_mean, fg_counts = _cell_mean(rgb, mask.astype(np.float32), MRC_FG_SCALE)
+    fg_mean = _fill_empty_cells(fg_mean, fg_counts)
+
+    # Stencil mask: sample 0 = paint foreground (PDF image mask default decode)
+    packed = np.packbits(~mask, axis=1)
+
+    return {
+        "width": W,
+        "height": H,
+        "has_text": bool(mask.any()),
+        "background": _jpeg_bytes(bg_mean, MRC_BG_QUALITY),
+        "foreground": _jpeg_bytes(fg_mean, MRC_FG_QUALITY),
+        "mask": packed.tobytes(),
+    }
+
+def _write_mrc_page(layers: Dict[str, Any], encoded_path: str, resolution: float):
+    """Assemble MRC layers into a single-page PDF (PyMuPDF; call from one thread at a time)."""
+    import fitz  # PyMuPDF
+
+    W, H = layers["width"], layers["height"]
+    rect = fitz.Rect(0, 0, W * 72.0 / resolution, H * 72.0 / resolution)
+
+    doc = fitz.open()
+    page = doc.new_page(width=rect.width, height=rect.height)
+    page.insert_image(rect, stream=layers["background"])
+
+    if layers["has_text"]:
+        fg_xref = page.insert_image(rect, stream=layers["foreground"])
+        mask_xref = doc.get_new_xref()
+        doc.update_object(mask_xref, f"<< /Type /XObject /Subtype /Image /Width {W} /Height {H}"
+                                     f" /ImageMask true /BitsPerComponent 1 >>")
+        doc.update_stream(mask_xref, layers["mask"], new=True)  # Flate-compressed by PyMuPDF
+        doc.xref_set_key(fg_xref, "Mask", f"{mask_xref} 0 R")
+
+    tmp_path = encoded_path + ".tmp"
+    doc.save(tmp_path, garbage=3, deflate=True)
+    doc.close()
+    os.replace(tmp_path, encoded_path)
+
+COMPRESSIONS = ("image", "mrc")
+
+def create_pdf(session_dir: str, modifications: list,
+               progress: Optional[Callable[[int, int], None]] = None,
+               check_cancelled: Optional[Callable[[], None]] = None,
+               compression: str = "image") -> str:
     """
     Generate a new PDF by compiling the page images from the session directory.
     Note: 'modifications' argument is kept for signature compatibility but unused
     because the images in session_dir are already modified in-place by apply_edit.
+
+    Each page is encoded to its own single-page PDF under .encoded/ and reused while
+    the page image's content hash matches the one recorded next to it (.key), so an
+    interrupted or repeated export only re-encodes pages that changed. Pages are
+    encoded in parallel.
     
     Args:
         session_dir: Session directory containing page images (page_*.png).
         modifications: Unused list of changes.
+        progress: Optional callback(completed, total) called after each page.
+        check_cancelled: Optional callback that raises to abort between pages.
+        compression: 'image' (one image per page) or 'mrc' (text mask over a
+            downsampled background, much smaller for text-heavy pages).
         
     Returns:
         Filename of the generated PDF (e.g., 'output.pdf').
     """
-    print(f"Generating PDF in {session_dir}...")
+    import fitz  # PyMuPDF
+
+    if compression not in COMPRESSIONS:
+        raise ValueError(f"Unknown compression '{compression}' (expected one of {', '.join(COMPRESSIONS)})")
+
+    print(f"Generating PDF in {session_dir} ({compression})...")
     
     # 1. Find all page images
     # Pattern: page_0.png, page_1.png...
@@ -34,32 +261,123 @@ def create_pdf(session_dir: str, modifications: list) -> str:
     # 2. Sort them correctly (page_1 vs page_10)
     image_paths.sort(key=natural_sort_key)
     
-    # 3. Load Images
-    images = []
+    # 3. Encode pages (skipping ones already encoded since their last edit)
+    # Each page is encoded at its render DPI so the output keeps the source page size
+    geometries = {g["index"]: g for g in coords.load_geometry(session_dir)}
+    encoded_dir = os.path.join(session_dir, ENCODED_DIR)
+    os.makedirs(encoded_dir, exist_ok=True)
+
+    suffix = ".mrc.pdf" if compression == "mrc" else ".pdf"
+    input_pdf = os.path.join(session_dir, "input.pdf")
+    encoded_paths, stale = [], []
     for path in image_paths:
-        img = Image.open(path)
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        images.append(img)
-        
-    if not images:
-        raise ValueError("No images loaded.")
+        name = os.path.splitext(os.path.basename(path))[0]
+        page_index = int(name.split("_")[1])
+        encoded_path = os.path.join(encoded_dir, name + suffix)
+        encoded_paths.append(encoded_path)
+
+        # Unedited image-only page: reuse the source page (and its image bytes) as is
+        geom = geometries.get(page_index)
+        if (compression == "image" and geom and geom.get("source", {}).get("type") == "embedded_image"
+                and os.path.exists(input_pdf) and not _is_page_modified(path)):
+            encoded_paths[-1] = os.path.join(encoded_dir, f"{name}.source.pdf")
+            if not os.path.exists(encoded_paths[-1]):
+                _copy_source_page(input_pdf, page_index, encoded_paths[-1])
+            continue
+
+        resolution = geom["dpi"] if geom and geom.get("dpi") else DEFAULT_RESOLUTION
+        sources = [path]
+        if compression == "mrc":
+            # Text regions come from the page's OCR blocks and what edits changed
+            sources.append(os.path.join(session_dir, block_store.BLOCKS_FILE.format(page_index)))
+            sources.append(path + ".original")
+        key = _encoding_key(sources, resolution)
+        if not os.path.exists(encoded_path) or _read_key(encoded_path) != key:
+            stale.append((page_index, path, encoded_path, resolution, key))
+
+    total = len(image_paths)
+    completed = total - len(stale)
+    if progress:
+        progress(completed, total)
+
+    def encode(page_index, path, encoded_path, resolution, key):
+        if compression == "mrc":
+            blocks = block_store.load_page_blocks(session_dir, page_index)
+            text_boxes = [b["bbox"] for b in blocks] if blocks is not None else None
+            return _mrc_layers(path, text_boxes)
+        _encode_page(path, encoded_path, resolution)
+        return None
+
+    # Pixel work runs on worker threads (numpy / PIL / zlib release the GIL);
+    # MRC pages are assembled here because PyMuPDF is not thread-safe.
+    with ThreadPoolExecutor(max_workers=ENCODE_WORKERS, thread_name_prefix="encode") as pool:
+        futures = [(pool.submit(encode, *job), job) for job in stale]
+        try:
+            for future, (page_index, path, encoded_path, resolution, key) in futures:
+                if check_cancelled:
+                    check_cancelled()
+                layers = future.result()
+                if layers is not None:
+                    _write_mrc_page(layers, encoded_path, resolution)
+                _write_key(encoded_path, key)
+                completed += 1
+                if progress:
+                    progress(completed, total)
+        except BaseException:
+            for future, _ in futures:
+                future.cancel()
+            raise
         
-    # 4. Save as PDF
+    # 4. Merge into one PDF
     output_filename = "output.pdf"
     output_path = os.path.join(session_dir, output_filename)
+
+    out = fitz.open()
+    for encoded_path in encoded_paths:
+        with fitz.open(encoded_path) as page_doc:
+            out.insert_pdf(page_doc)
+    out.save(output_path)
+    out.close()
     
-    # first image saves, others are appended
-    images[0].save(
-        output_path, "PDF", resolution=100.0, save_all=True, append_images=images[1:]
-    )
-    
-    print(f"PDF saved to {output_path}")
+    print(f"PDF saved to {output_path} ({os.path.getsize(output_path) // 1024} KB)")
     return output_filename
 
+def _is_page_modified(image_path: str) -> bool:
+    """True if the page image differs from its pre-edit backup (editor_engine's '.original')."""
+    original_path = image_path + ".original"
+    if not os.path.exists(original_path):
+        return False  # Never edited
+    return not filecmp.cmp(image_path, original_path, shallow=False)
+
+def _changed_region(image_path: str, original_path: str, align: int = 16):
+    """
+    Bounding box (left, top, right, bottom) of pixels that differ between the edited page
+    and its original, expanded to the JPEG MCU grid (16px covers 4:2:0 subsampling).
+    Returns None if nothing changed.
+    """
+    with Image.open(image_path) as edited, Image.open(original_path) as original:
+        bbox = ImageChops.difference(edited.convert("RGB"), original.convert("RGB")).getbbox()
+        width, height = edited.size
+    if bbox is None:
+        return None
+    left, top, right, bottom = bbox
+    return (
+        left // align * align,
+        top // align * align,
+        min(width, -(-right // align) * align),
+        min(height, -(-bottom // align) * align),
+    )
+
 def create_image(session_dir: str, output_ext: str) -> str:
     """
     Export the single page image in the requested format.
+
+    - Unmodified page (or page_0.png never decoded from a JPEG upload): the uploaded
+      input file is returned byte-for-byte.
+    - PNG output: the edited page_0.png is already PNG and is copied as is.
+    - JPEG output from a JPEG input: only the changed MCU-aligned region is pasted into
+      the decoded original, which is re-encoded with the original quantization tables
+      and subsampling (quality="keep"), so untouched areas keep their original quality.
     
     Args:
         session_dir: Session directory.
@@ -69,21 +387,45 @@ def create_image(session_dir: str, output_ext: str) -> str:
         Filename of the generated image.
     """
     image_path = os.path.join(session_dir, "page_0.png")
-    if not os.path.exists(image_path):
-        raise FileNotFoundError("Page image not found.")
-        
-    img = Image.open(image_path)
-    
     output_filename = f"output{output_ext}"
     output_path = os.path.join(session_dir, output_filename)
+    input_path = os.path.join(session_dir, f"input{output_ext}")
+    if not os.path.exists(image_path) and not os.path.exists(input_path):
+        raise FileNotFoundError("Page image not found.")
     
     ext = output_ext.lower()
-    if ext in [".jpg", ".jpeg"]:
-        if img.mode != "RGB":
-            img = img.convert("RGB")
-        img.save(output_path, "JPEG", quality=95)
-    else:
-        img.save(output_path, "PNG")
+
+    # 1. Lossless passthrough
+    if os.path.exists(input_path) and (not os.path.exists(image_path) or not _is_page_modified(image_path)):
+        shutil.copyfile(input_path, output_path)
+        print(f"Image unchanged, copied {input_path} to {output_path}")
+        return output_filename
+
+    if ext not in [".jpg", ".jpeg"]:
+        shutil.copyfile(image_path, output_path)
+        print(f"Image saved to {output_path}")
+        return output_filename
+
+    # 2. JPEG: patch only the changed region into the original JPEG
+    original_path = image_path + ".original"
+    if os.path.exists(input_path) and os.path.exists(original_path):
+        with Image.open(input_path) as src:
+            if src.format == "JPEG" and src.mode == "RGB":
+                region = _changed_region(image_path, original_path)
+                src.load()
+                if region is not None:
+                    with Image.open(image_path) as edited:
+                        src.paste(edited.convert("RGB").crop(region), region[:2])
+                src.save(output_path, "JPEG", quality="keep",
+                         exif=src.info.get("exif", b""), icc_profile=src.info.get("icc_profile"))
+                print(f"Image saved to {output_path} (re-encoded region {region})")
+                return output_filename
+
+    # 3. Fallback: full re-encode
+    img = Image.open(image_path)
+    if img.mode != "RGB":
+        img = img.convert("RGB")
+    img.save(output_path, "JPEG", quality=95)
         
     print(f"Image saved to {output_path}")
     return output_filename
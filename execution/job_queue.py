@@ -0,0 +1,194 @@
+import json
+import logging
+import os
+import queue
+import threading
+import time
+import uuid
+from typing import Any, Callable, Dict, Optional
+
+logger = logging.getLogger(__name__)
+
+# Job states
+QUEUED = "queued"
+RUNNING = "running"
+DONE = "done"
+FAILED = "failed"
+CANCELLED = "cancelled"
+
+TERMINAL_STATES = (DONE, FAILED, CANCELLED)
+
+class JobCancelled(Exception):
+    """Raised by a handler (via JobContext.check_cancelled) when its job was cancelled."""
+
+class JobContext:
+    """
+    Handed to job handlers: report per-page progress and check for cancellation.
+    Handlers must be resumable - after a server restart the same job is run again
+    and should skip work whose output already exists on disk.
+    """
+    def __init__(self, store: "JobStore", job_id: str):
+        self.store = store
+        self.job_id = job_id
+
+    def progress(self, completed: int, total: Optional[int] = None, message: Optional[str] = None):
+        fields = {"completed": completed}
+        if total is not None:
+            fields["total"] = total
+        if message is not None:
+            fields["message"] = message
+        self.store.update(self.job_id, **fields)
+
+    def check_cancelled(self):
+        if self.store.is_cancel_requested(self.job_id):
+            raise JobCancelled(self.job_id)
+
+class JobStore:
+    """
+    Jobs persisted as one JSON file each under jobs_dir, so they survive restarts.
+    Writes go through a temp file + os.replace to stay atomic.
+    """
+    def __init__(self, jobs_dir: str):
+        self.jobs_dir = jobs_dir
+        self._lock = threading.Lock()
+        os.makedirs(jobs_dir, exist_ok=True)
+
+    def _path(self, job_id: str) -> str:
+        return os.path.join(self.jobs_dir, f"{job_id}.json")
+
+    def _write(self, job: Dict[str, Any]):
+        path = self._path(job["id"])
+        tmp_path = path + ".tmp"
+        with open(tmp_path, "w", encoding="utf-8") as f:
+            json.dump(job, f)
+        os.replace(tmp_path, path)
+
+    def create(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        now = time.time()
+        job = {
+            "id": str(uuid.uuid4()),
+            "kind": kind,
+            "params": params,
+            "status": QUEUED,
+            "total": 0,
+            "completed": 0,
+            "message": None,
+            "result": None,
+            "error": None,
+            "cancel_requested": False,
+            "created_at": now,
+            "updated_at": now,
+        }
+        with self._lock:
+            self._write(job)
+        return job
+
+    def get(self, job_id: str) -> Optional[Dict[str, Any]]:
+        # job_id comes from URLs; only accept plain ids
+        if not job_id or os.path.basename(job_id) != job_id:
+            return None
+        try:
+            with open(self._path(job_id), "r", encoding="utf-8") as f:
+                return json.load(f)
+        except (FileNotFoundError, json.JSONDecodeError):
+            return None
+
+    def update(self, job_id: str, **fields) -> Optional[Dict[str, Any]]:
+        with self._lock:
+            job = self.get(job_id)
+            if job is None:
+                return None
+            job.update(fields)
+            job["updated_at"] = time.time()
+            self._write(job)
+            return job
+
+    def is_cancel_requested(self, job_id: str) -> bool:
+        job = self.get(job_id)
+        return job is None or job.get("cancel_requested", False)
+
+    def unfinished(self):
+        """Jobs that were queued or running when the server last stopped, oldest first."""
+        jobs = []
+        for name in os.listdir(self.jobs_dir):
+            if not name.endswith(".json"):
+                continue
+            job = self.get(name[:-len(".json")])
+            if job and job["status"] not in TERMINAL_STATES:
+                jobs.append(job)
+        return sorted(jobs, key=lambda j: j["created_at"])
+
+class JobQueue:
+    """
+    Background worker threads that run persisted jobs.
+    Handlers are registered per job kind: handler(params, ctx) -> result dict.
+    """
+    def __init__(self, store: JobStore, workers: int = 1):
+        self.store = store
+        self.workers = workers
+        self._handlers: Dict[str, Callable[[Dict[str, Any], JobContext], Dict[str, Any]]] = {}
+        self._queue: "queue.Queue[str]" = queue.Queue()
+        self._threads = []
+
+    def register(self, kind: str, handler: Callable[[Dict[str, Any], JobContext], Dict[str, Any]]):
+        self._handlers[kind] = handler
+
+    def start(self):
+        """Start workers and re-enqueue jobs left unfinished by a previous run."""
+        for job in self.store.unfinished():
+            logger.info(f"Resuming job {job['id']} ({job['kind']}, {job['completed']}/{job['total']} done)")
+            self._queue.put(job["id"])
+
+        for n in range(self.workers):
+            t = threading.Thread(target=self._run, name=f"job-worker-{n}", daemon=True)
+            t.start()
+            self._threads.append(t)
+
+    def submit(self, kind: str, params: Dict[str, Any]) -> Dict[str, Any]:
+        if kind not in self._handlers:
+            raise ValueError(f"Unknown job kind: {kind}")
+        job = self.store.create(kind, params)
+        self._queue.put(job["id"])
+        return job
+
+    def cancel(self, job_id: str) -> Optional[Dict[str, Any]]:
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATES:
+            return job
+        if job["status"] == QUEUED:
+            return self.store.update(job_id, cancel_requested=True, status=CANCELLED)
+        # Running: the handler stops at its next check_cancelled()
+        return self.store.update(job_id, cancel_requested=True)
+
+    def _run(self):
+        while True:
+            job_id = self._queue.get()
+            try:
+                self._execute(job_id)
+            finally:
+                self._queue.task_done()
+
+    def _execute(self, job_id: str):
+        job = self.store.get(job_id)
+        if job is None or job["status"] in TERMINAL_STATES:
+            return
+
+        handler = self._handlers.get(job["kind"])
+        if handler is None:
+            self.store.update(job_id, status=FAILED, error=f"Unknown job kind: {job['kind']}")
+            return
+
+        self.store.update(job_id, status=RUNNING)
+        ctx = JobContext(self.store, job_id)
+        start = time.perf_counter()
+        try:
+            ctx.check_cancelled()
+            result = handler(job["params"], ctx)
+            self.store.update(job_id, status=DONE, result=result)
+            logger.info(f"Job {job_id} ({job['kind']}) done in {time.perf_counter() - start:.1f}s")
+        except JobCancelled:
+            self.store.update(job_id, status=CANCELLED)
+            logger.info(f"Job {job_id} cancelled")
+        except Exception as e:
+            logger.error(f"Job {job_id} ({job['kind']}) failed: {e}")
+            self.store.update(job_id, status=FAILED, error=str(e))
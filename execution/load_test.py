@@ -0,0 +1,337 @@
+"""
+Concurrent-user load test for server.py.
+
+Each simulated session runs: upload -> analyze every page -> repeated /update-page -> /generate.
+By default a uvicorn server is started in a subprocess and driven over HTTP, so requests are
+handled concurrently exactly as in production and the server's RSS is sampled from outside.
+--url targets a server that is already running.
+
+Usage:
+    python -m execution.load_test --sessions 8 --pages 5 --edits 10 --engines mock \\
+        --ocr-latency 0.3 --inpaint-latency 0.5
+    python -m execution.load_test --url http://localhost:8000 --sessions 4 --engines real
+
+--engines mock uses the 'mock' OCR engine and the 'mock' inpaint method (deterministic,
+with the given simulated latencies). For --url runs, start the server with
+MOCK_OCR_LATENCY / MOCK_INPAINT_LATENCY set instead.
+
+--in-process drives the ASGI app through httpx.ASGITransport instead (no network, startup
+hooks run). Client and server then share one event loop and one process: handy for smoke
+tests, but latencies and RSS include the client, so use the default mode for numbers.
+"""
+import argparse
+import asyncio
+import json
+import os
+import random
+import resource
+import socket
+import subprocess
+import sys
+import tempfile
+import time
+from collections import defaultdict
+from contextlib import AsyncExitStack
+from typing import Any, Dict, List, Optional, Tuple
+
+# Slide size of the synthetic deck (pt), 16:9
+PAGE_WIDTH_PT = 960
+PAGE_HEIGHT_PT = 540
+
+ROOT_DIR = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+SERVER_START_TIMEOUT = 60.0
+
+def make_test_pdf(path: str, pages: int):
+    """Write a synthetic deck with a few lines of text per page."""
+    import fitz
+
+    doc = fitz.open()
+    for i in range(pages):
+        page = doc.new_page(width=PAGE_WIDTH_PT, height=PAGE_HEIGHT_PT)
+        page.insert_text((60, 80), f"Load test slide {i + 1}", fontsize=36)
+        for n in range(5):
+            page.insert_text((60, 160 + n * 60), f"Bullet point {n + 1} on slide {i + 1}", fontsize=20)
+        page.insert_text((60, 510), "Footer text", fontsize=12)
+    doc.save(path)
+    doc.close()
+
+def percentile(values: List[float], pct: float) -> Optional[float]:
+    if not values:
+        return None
+    values = sorted(values)
+    k = (len(values) - 1) * pct / 100.0
+    lo, hi = int(k), min(int(k) + 1, len(values) - 1)
+    return values[lo] + (values[hi] - values[lo]) * (k - lo)
+
+def read_rss_mb(pid: Optional[int] = None) -> Optional[float]:
+    """Current resident set size of pid (default: this process) in MB."""
+    try:
+        with open(f"/proc/{pid or 'self'}/statm") as f:
+            pages = int(f.read().split()[1])
+        return pages * os.sysconf("SC_PAGE_SIZE") / 1e6
+    except (OSError, ValueError, IndexError):
+        if pid:
+            return None
+        # Non-Linux: peak RSS only (KB on Linux, bytes on macOS)
+        peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+        return peak / 1e6 if sys.platform == "darwin" else peak / 1e3
+
+class Stats:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.errors = defaultdict(int)
+        self.rss = []
+
+    async def call(self, client, endpoint: str, method: str, url: str, **kwargs):
+        start = time.perf_counter()
+        try:
+            resp = await client.request(method, url, **kwargs)
+            ok = resp.status_code < 400
+        except Exception:
+            resp, ok = None, False
+        self.latencies[endpoint].append(time.perf_counter() - start)
+        if not ok:
+            self.errors[endpoint] += 1
+            return None
+        return resp.json()
+
+async def run_session(client, stats: Stats, pdf_bytes: bytes, n: int, edits: int,
+                      engines: str, think_time: float, rng: random.Random):
+    upload = await stats.call(client, "/upload", "POST", "/upload",
+                              files={"file": (f"deck_{n}.pdf", pdf_bytes, "application/pdf")})
+    if not upload:
+        return
+    session_id = upload["session_id"]
+    page_count = len(upload["pages"])
+
+    ocr_engine = "mock" if engines == "mock" else "paddle"
+    inpaint_method = "mock" if engines == "mock" else "lama"
+
+    blocks = {}
+    for page_index in range(page_count):
+        result = await stats.call(client, "/analyze", "POST", "/analyze",
+                                  json={"session_id": session_id, "page_index": page_index, "engine": ocr_engine})
+        blocks[page_index] = result["blocks"] if result else []
+
+    # Edits accumulate per page, like the editor: each call replays the page's full edit list
+    page_edits = defaultdict(list)
+    for e in range(edits):
+        candidates = [p for p in blocks if blocks[p]]
+        if not candidates:
+            break
+        page_index = rng.choice(candidates)
+        block = rng.choice(blocks[page_index])
+        page_edits[page_index].append({
+            "bbox": block["bbox"],
+            "text": f"Edited {e} ({block['text'][:20]})",
+            "inpaint_method": inpaint_method,
+        })
+        await stats.call(client, "/update-page", "POST", "/update-page",
+                         json={"session_id": session_id, "page_index": page_index, "edits": page_edits[page_index]})
+        if think_time:
+            await asyncio.sleep(rng.uniform(0, 2 * think_time))
+
+    await stats.call(client, "/generate", "POST", "/generate",
+                     json={"session_id": session_id, "modifications": []})
+
+async def sample_rss(stats: Stats, pid: Optional[int], start: float, interval: float, stop: asyncio.Event):
+    while not stop.is_set():
+        rss = read_rss_mb(pid)
+        if rss is not None:
+            stats.rss.append((round(time.perf_counter() - start, 2), round(rss, 1)))
+        try:
+            await asyncio.wait_for(stop.wait(), timeout=interval)
+        except asyncio.TimeoutError:
+            pass
+
+def start_server(engines: str, ocr_latency: Optional[float] = None,
+                 inpaint_latency: Optional[float] = None) -> Tuple[subprocess.Popen, str, str]:
+    """Start server.py under uvicorn on a free local port. Returns (process, url, log path)."""
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        port = s.getsockname()[1]
+
+    env = dict(os.environ)
+    if engines == "mock":
+        env.setdefault("PRE_INPAINT", "0")  # keep real LaMa out of mock runs
+    if ocr_latency is not None:
+        env["MOCK_OCR_LATENCY"] = str(ocr_latency)
+    if inpaint_latency is not None:
+        env["MOCK_INPAINT_LATENCY"] = str(inpaint_latency)
+
+    log = tempfile.NamedTemporaryFile(prefix="load_test_server_", suffix=".log", delete=False)
+    proc = subprocess.Popen([sys.executable, "-m", "uvicorn", "server:app", "--host", "127.0.0.1",
+                             "--port", str(port), "--log-level", "warning"],
+                            cwd=ROOT_DIR, env=env, stdout=log, stderr=subprocess.STDOUT)
+    log.close()
+    return proc, f"http://127.0.0.1:{port}", log.name
+
+async def wait_for_server(client, proc: subprocess.Popen, log_path: str):
+    deadline = time.monotonic() + SERVER_START_TIMEOUT
+    while time.monotonic() < deadline:
+        if proc.poll() is not None:
+            break
+        try:
+            if (await client.get("/metrics")).status_code == 200:
+                return
+        except Exception:
+            pass
+        await asyncio.sleep(0.2)
+    with open(log_path, encoding="utf-8", errors="replace") as f:
+        tail = f.read()[-2000:]
+    raise RuntimeError(f"Server did not start:\n{tail}")
+
+async def run_load_test(sessions: int, pages: int, edits: int, engines: str = "mock",
+                        url: Optional[str] = None, server_pid: Optional[int] = None,
+                        think_time: float = 0.0, seed: int = 0, rss_interval: float = 1.0,
+                        pdf_path: Optional[str] = None, in_process: bool = False,
+                        ocr_latency: Optional[float] = None,
+                        inpaint_latency: Optional[float] = None) -> Dict[str, Any]:
+    import httpx
+
+    if pdf_path:
+        with open(pdf_path, "rb") as f:
+            pdf_bytes = f.read()
+    else:
+        with tempfile.TemporaryDirectory() as tmp:
+            path = os.path.join(tmp, "deck.pdf")
+            make_test_pdf(path, pages)
+            with open(path, "rb") as f:
+                pdf_bytes = f.read()
+
+    proc = None
+    async with AsyncExitStack() as stack:
+        if url:
+            mode = "url"
+            client = httpx.AsyncClient(base_url=url, timeout=None)
+        elif in_process:
+            mode = "in-process"
+            if engines == "mock":
+                os.environ.setdefault("PRE_INPAINT", "0")  # keep real LaMa out of mock runs
+            from execution import ocr_engine, editor_engine
+            if ocr_latency is not None:
+                ocr_engine.MOCK_OCR_LATENCY = ocr_latency
+            if inpaint_latency is not None:
+                editor_engine.MOCK_INPAINT_LATENCY = inpaint_latency
+            from server import app
+            await stack.enter_async_context(app.router.lifespan_context(app))  # startup / shutdown hooks
+            client = httpx.AsyncClient(transport=httpx.ASGITransport(app=app), base_url="http://loadtest", timeout=None)
+            server_pid = None  # the server is this process
+        else:
+            mode = "subprocess"
+            proc, url, log_path = start_server(engines, ocr_latency, inpaint_latency)
+            stack.callback(os.remove, log_path)
+            stack.callback(_stop_server, proc)  # runs first
+            server_pid = proc.pid
+            client = httpx.AsyncClient(base_url=url, timeout=None)
+
+        await stack.enter_async_context(client)
+        if proc is not None:
+            await wait_for_server(client, proc, log_path)
+
+        stats = Stats()
+        stop = asyncio.Event()
+        start = time.perf_counter()
+        sampler = asyncio.create_task(sample_rss(stats, server_pid, start, rss_interval, stop))
+
+        await asyncio.gather(*[
+            run_session(client, stats, pdf_bytes, n, edits, engines, think_time, random.Random(seed + n))
+            for n in range(sessions)
+        ])
+        try:
+            server_metrics = (await client.get("/metrics")).json()
+        except Exception:
+            server_metrics = None
+
+        elapsed = time.perf_counter() - start
+        stop.set()
+        await sampler
+
+    endpoints = {}
+    for endpoint, lat in stats.latencies.items():
+        endpoints[endpoint] = {
+            "requests": len(lat),
+            "errors": stats.errors[endpoint],
+            "error_rate": round(stats.errors[endpoint] / len(lat), 4),
+            "throughput_rps": round(len(lat) / elapsed, 2),
+            "p50_ms": round(percentile(lat, 50) * 1000, 1),
+            "p95_ms": round(percentile(lat, 95) * 1000, 1),
+            "p99_ms": round(percentile(lat, 99) * 1000, 1),
+        }
+
+    total_requests = sum(len(v) for v in stats.latencies.values())
+    rss_values = [r for _, r in stats.rss]
+    return {
+        "sessions": sessions,
+        "engines": engines,
+        "mode": mode,
+        "elapsed_s": round(elapsed, 2),
+        "sessions_per_min": round(sessions / elapsed * 60, 2),
+        "requests": total_requests,
+        "throughput_rps": round(total_requests / elapsed, 2),
+        "endpoints": endpoints,
+        "rss_mb": {
+            "start": rss_values[0] if rss_values else None,
+            "peak": max(rss_values) if rss_values else None,
+            "end": rss_values[-1] if rss_values else None,
+            "samples": stats.rss,
+        },
+        "server_metrics": server_metrics,
+    }
+
+def _stop_server(proc: subprocess.Popen):
+    proc.terminate()
+    try:
+        proc.wait(timeout=10)
+    except subprocess.TimeoutExpired:
+        proc.kill()
+        proc.wait()
+
+def print_report(report: Dict[str, Any]):
+    print(f"\n{report['sessions']} sessions ({report['engines']} engines, {report['mode']}) in {report['elapsed_s']}s"
+          f" - {report['throughput_rps']} req/s, {report['sessions_per_min']} sessions/min")
+    print(f"{'endpoint':<14}{'reqs':>7}{'err%':>8}{'rps':>8}{'p50 ms':>10}{'p95 ms':>10}{'p99 ms':>10}")
+    for endpoint, e in report["endpoints"].items():
+        print(f"{endpoint:<14}{e['requests']:>7}{e['error_rate'] * 100:>7.1f}%{e['throughput_rps']:>8}"
+              f"{e['p50_ms']:>10}{e['p95_ms']:>10}{e['p99_ms']:>10}")
+    rss = report["rss_mb"]
+    print(f"Server RSS (MB): start {rss['start']}, peak {rss['peak']}, end {rss['end']}")
+    cpu = (report.get("server_metrics") or {}).get("cpu")
+    if cpu:
+        print(f"CPU budget: {cpu['cpu_cores']} cores, utilization {cpu['utilization'] * 100:.1f}%")
+        for name, e in cpu["engines"].items():
+            print(f"  {name:<8} {e['threads']} threads, {e['completed']} jobs, max queued {e['max_queued']},"
+                  f" avg wait {e['avg_wait_ms']} ms, avg run {e['avg_run_ms']} ms")
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description="Simulate concurrent editing sessions against server.py.")
+    parser.add_argument("--sessions", type=int, default=4, help="Concurrent simulated sessions")
+    parser.add_argument("--pages", type=int, default=5, help="Pages in the synthetic deck")
+    parser.add_argument("--edits", type=int, default=10, help="/update-page calls per session")
+    parser.add_argument("--engines", choices=["mock", "real"], default="mock",
+                        help="mock: deterministic OCR/inpaint stand-ins; real: PaddleOCR + LaMa")
+    parser.add_argument("--ocr-latency", type=float, default=None, help="Mock OCR latency (s); not with --url")
+    parser.add_argument("--inpaint-latency", type=float, default=None, help="Mock inpaint latency (s); not with --url")
+    parser.add_argument("--think-time", type=float, default=0.0, help="Mean pause between edits (s)")
+    parser.add_argument("--url", default=None, help="Target a running server instead of starting one")
+    parser.add_argument("--in-process", action="store_true",
+                        help="Drive the ASGI app in this process (smoke tests; not representative numbers)")
+    parser.add_argument("--server-pid", type=int, default=None, help="PID to sample RSS from with --url")
+    parser.add_argument("--pdf", default=None, help="Use this PDF instead of a synthetic deck")
+    parser.add_argument("--seed", type=int, default=0)
+    parser.add_argument("--json", default=None, help="Also write the full report (incl. RSS samples) here")
+    args = parser.parse_args(argv)
+
+    report = asyncio.run(run_load_test(
+        args.sessions, args.pages, args.edits, engines=args.engines, url=args.url,
+        server_pid=args.server_pid, think_time=args.think_time, seed=args.seed, pdf_path=args.pdf,
+        in_process=args.in_process, ocr_latency=args.ocr_latency, inpaint_latency=args.inpaint_latency,
+    ))
+    print_report(report)
+
+    if args.json:
+        with open(args.json, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+
+if __name__ == "__main__":
+    main()
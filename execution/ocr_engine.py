@@ -1,6 +1,10 @@
+import os
+import time
 import threading
 import logging
 
+from execution import cpu_scheduler
+
 logger = logging.getLogger(__name__)
 
 from typing import List, Dict, Any, Union
@@ -9,6 +13,16 @@ from typing import List, Dict, Any, Union
 _ocr_engine = None
 _ocr_lock = threading.Lock()
 
+# Stock PaddleOCR 2.7 pipeline settings. The detector already resizes the page so its
+# longest side is DET_LIMIT_SIDE_LEN ('max'), so a 200-dpi slide is never detected at full
+# size; recognition crops are batched REC_BATCH_NUM at a time. Defaults are PaddleOCR's own;
+# raise the side length for small text, the batch size for pages with many lines.
+DET_LIMIT_SIDE_LEN = int(os.environ.get("OCR_DET_LIMIT_SIDE_LEN", "960"))
+REC_BATCH_NUM = int(os.environ.get("OCR_REC_BATCH_NUM", "6"))
+
+# Simulated model latency (seconds) of the 'mock' engine, e.g. for load tests
+MOCK_OCR_LATENCY = float(os.environ.get("MOCK_OCR_LATENCY", "0"))
+
 def get_ocr_engine(lang='ch'):
     global _ocr_engine
     if _ocr_engine is None:
@@ -22,7 +36,11 @@ def get_ocr_engine(lang='ch'):
                 use_angle_cls=False, 
                 lang=lang, 
                 use_doc_orientation_classify=False,
-                use_doc_unwarping=False
+                use_doc_unwarping=False,
+                cpu_threads=cpu_scheduler.threads_for("ocr"),
+                det_limit_side_len=DET_LIMIT_SIDE_LEN,
+                det_limit_type="max",
+                rec_batch_num=REC_BATCH_NUM
             )
 
         except ImportError:
@@ -32,15 +50,26 @@ def get_ocr_engine(lang='ch'):
 
 
 def analyze_image(image_path: str, engine='paddle') -> List[Dict[str, Any]]:
-    # ...
+    """
+    Run OCR on a page image.
+
+    engine:
+        'paddle' - PaddleOCR (detection on the page scaled to DET_LIMIT_SIDE_LEN,
+                   recognition batched REC_BATCH_NUM crops at a time).
+        'mock'   - Fixed fake blocks (no model needed).
+
+    Runs with the OCR thread budget (cpu_scheduler), one page at a time (the model is not thread-safe).
+    """
+    with cpu_scheduler.slot("ocr", _ocr_lock):
+        return _analyze(image_path, engine)
+
+def _analyze(image_path: str, engine: str) -> List[Dict[str, Any]]:
     if engine == 'mock':
         return _mock_analysis(image_path)
-        
+
     try:
         ocr = get_ocr_engine()
-        # Lock to ensure thread safety
-        with _ocr_lock:
-            result = ocr.ocr(image_path)
+        result = ocr.ocr(image_path)  # analyze_image holds _ocr_lock
             
         logger.info(f"DEBUG: OCR Result type: {type(result)}")
         # Log summary instead of full result to avoid huge logs
@@ -131,9 +160,10 @@ def _parse_paddle_result(result) -> List[Dict[str, Any]]:
     return blocks
 
 
-
 def _mock_analysis(image_path):
     print(f"Mock analyzing: {image_path}")
+    if MOCK_OCR_LATENCY > 0:
+        time.sleep(MOCK_OCR_LATENCY)
     blocks = []
     for i in range(5):
         blocks.append({
@@ -0,0 +1,84 @@
+import asyncio
+import logging
+from collections import deque
+from concurrent.futures import Executor
+from typing import Any, Callable, Dict, Hashable, Optional
+
+logger = logging.getLogger(__name__)
+
+class PageUpdateQueue:
+    """
+    Serializes rebuilds of the same page and coalesces bursts (latest wins).
+
+    At most one rebuild per page key runs at a time. Requests arriving while it runs
+    wait as a single pending slot; a newer request replaces the pending one, which is
+    then answered with the result of the rebuild that superseded it. So a burst of N
+    requests costs at most two rebuilds: the running one and the latest.
+
+    Requests submitted with coalesce=False (e.g. restoring a page) are never replaced
+    and never replace another: they wait in line and run in arrival order, and requests
+    after them start a new slot.
+
+    Must be used from one event loop; rebuilds run on the given executor.
+    """
+    def __init__(self, executor: Executor):
+        self.executor = executor
+        self._pages: Dict[Hashable, Dict[str, Any]] = {}
+
+    async def submit(self, key: Hashable, rebuild: Callable[[], Dict[str, Any]],
+                     coalesce: bool = True) -> Dict[str, Any]:
+        """
+        Run rebuild() for this page key (or, if coalesce, let a newer request replace it).
+        Returns rebuild()'s result, or for superseded requests the final result with
+        status 'superseded' and 'superseded_by' (the request number that replaced it).
+        """
+        loop = asyncio.get_running_loop()
+        state = self._pages.setdefault(key, {"running": False, "pending": deque(), "seq": 0})
+        state["seq"] += 1
+        request = {"seq": state["seq"], "rebuild": rebuild, "future": loop.create_future(),
+                   "superseded": [], "coalesce": coalesce}
+
+        if state["running"]:
+            pending = state["pending"]
+            if coalesce and pending and pending[-1]["coalesce"]:
+                previous = pending.pop()
+                request["superseded"] = previous["superseded"] + [previous]
+                previous["superseded"] = []
+                logger.info(f"Page {key}: request {previous['seq']} superseded by {request['seq']}")
+            pending.append(request)
+        else:
+            state["running"] = True
+            loop.create_task(self._drain(key, state, request))
+
+        return await request["future"]
+
+    async def _drain(self, key: Hashable, state: Dict[str, Any], request: Optional[Dict[str, Any]]):
+        loop = asyncio.get_running_loop()
+        try:
+            while request is not None:
+                try:
+                    result = await loop.run_in_executor(self.executor, request["rebuild"])
+                    error = None
+                except Exception as e:
+                    result, error = None, e
+
+                self._resolve(request, result, error)
+                for old in request["superseded"]:
+                    superseded = None if result is None else dict(result, status="superseded", superseded_by=request["seq"])
+                    self._resolve(old, superseded, error)
+
+                request = state["pending"].popleft() if state["pending"] else None
+        finally:
+            state["running"] = False
+            if not state["pending"] and self._pages.get(key) is state:
+                del self._pages[key]
+
+    @staticmethod
+    def _resolve(request: Dict[str, Any], result: Optional[Dict[str, Any]], error: Optional[Exception]):
+        fut = request["future"]
+        if fut.done():  # Client went away
+            return
+        if error is not None:
+            fut.set_exception(error)
+        else:
+            fut.set_result(result)
@@ -0,0 +1,69 @@
+"""
+Content-hash versions for page images, used to build cacheable URLs:
+
+    /pages/{session_id}/{version}/page_N.png
+
+The version changes whenever the file's bytes change, so a versioned URL can be
+served with a strong ETag and "immutable" cache headers; an edited page simply
+gets a new URL. Hashes are memoized by (mtime, size) so unchanged pages are not
+re-read.
+"""
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+from typing import Optional, Tuple
+
+from execution import process_image
+
+PAGE_FILE_PATTERN = re.compile(r"^page_\d+\.png$")
+VERSION_LENGTH = 16  # hex chars of the sha1
+MAX_MEMO_ENTRIES = 10000
+
+_memo: "OrderedDict[str, Tuple[int, int, str]]" = OrderedDict()  # path -> (mtime_ns, size, version)
+_memo_lock = threading.Lock()
+
+def page_version(image_path: str) -> str:
+    """Short content hash of the file."""
+    st = os.stat(image_path)
+    with _memo_lock:
+        entry = _memo.get(image_path)
+        if entry is not None and entry[:2] == (st.st_mtime_ns, st.st_size):
+            _memo.move_to_end(image_path)
+            return entry[2]
+
+    digest = hashlib.sha1()
+    with open(image_path, "rb") as f:
+        for chunk in iter(lambda: f.read(1 << 20), b""):
+            digest.update(chunk)
+    version = digest.hexdigest()[:VERSION_LENGTH]
+
+    with _memo_lock:
+        _memo[image_path] = (st.st_mtime_ns, st.st_size, version)
+        _memo.move_to_end(image_path)
+        while len(_memo) > MAX_MEMO_ENTRIES:
+            _memo.popitem(last=False)
+    return version
+
+def page_url(session_id: str, session_dir: str, filename: str) -> str:
+    """Versioned URL of a page image in the session directory (or of its still-encoded source)."""
+    version = page_version(process_image.display_path(session_dir, filename))
+    return f"/pages/{session_id}/{version}/{filename}"
+
+def etag(version: str) -> str:
+    return f'"{version}"'
+
+def etag_matches(if_none_match: Optional[str], version: str) -> bool:
+    """True if an If-None-Match header value matches the version (weak comparison, as RFC 9110 requires)."""
+    if not if_none_match:
+        return False
+    for tag in if_none_match.split(","):
+        tag = tag.strip()
+        if tag == "*":
+            return True
+        if tag.startswith("W/"):
+            tag = tag[2:]
+        if tag == etag(version):
+            return True
+    return False
@@ -0,0 +1,133 @@
+"""
+Speculative background pre-inpainting.
+
+After /analyze, every detected block of the page is queued. A single low-priority
+thread takes the queued blocks of one page at a time, decodes the page once and
+inpaints the blocks one by one with LaMa (editor_engine.precompute_patch) while
+no interactive edit is running, so the user's first edit of a block hits the patch
+cache instead of waiting for the model.
+
+- Preemption: the worker waits until editor_engine reports idle before each block, and
+  precompute_patch gives the model up if an interactive edit starts waiting for it.
+  An interactive edit waits at most for the one block in progress.
+- Fairness: sessions are served round-robin, one page at a time.
+- Budget: each session gets at most MAX_BLOCKS_PER_SESSION blocks and
+  MAX_SECONDS_PER_SESSION seconds of model time. Budgets of idle sessions are kept
+  for the MAX_TRACKED_SESSIONS most recent ones only.
+"""
+import logging
+import threading
+import time
+from collections import OrderedDict, deque
+from typing import Any, Dict, List
+
+from execution import editor_engine
+
+logger = logging.getLogger(__name__)
+
+MAX_BLOCKS_PER_SESSION = 200
+MAX_SECONDS_PER_SESSION = 120.0
+MAX_TRACKED_SESSIONS = 1024
+DEFAULT_FILL_SIZE = "100%"
+
+_queues: "OrderedDict[str, deque]" = OrderedDict()            # session_id -> deque of (image_path, bbox)
+_budgets: "OrderedDict[str, Dict[str, float]]" = OrderedDict()  # session_id -> {"blocks": n, "seconds": s}, LRU
+_cond = threading.Condition()
+_worker = None
+_stats = {"computed": 0, "skipped": 0}
+
+def enqueue(session_id: str, image_path: str, blocks: List[Dict[str, Any]]):
+    """Queue a page's OCR blocks for pre-inpainting (replaces earlier queued work for that page)."""
+    if editor_engine.SimpleLama is None:
+        return
+    _ensure_worker()
+    with _cond:
+        queue = _queues.setdefault(session_id, deque())
+        for item in [i for i in queue if i[0] == image_path]:
+            queue.remove(item)
+        queue.extend((image_path, block["bbox"]) for block in blocks)
+        _budgets.setdefault(session_id, {"blocks": 0, "seconds": 0.0})
+        _budgets.move_to_end(session_id)
+        _trim_budgets()
+        _cond.notify()
+
+def _trim_budgets():
+    """Drop the least recently used budgets of sessions without queued work (call with _cond held)."""
+    for session_id in list(_budgets):
+        if len(_budgets) <= MAX_TRACKED_SESSIONS:
+            break
+        if session_id not in _queues:
+            del _budgets[session_id]
+
+def stats() -> Dict[str, Any]:
+    with _cond:
+        return dict(_stats, queued=sum(len(q) for q in _queues.values()), sessions=len(_queues))
+
+def _ensure_worker():
+    global _worker
+    with _cond:
+        if _worker is None:
+            _worker = threading.Thread(target=_run, name="pre-inpaint", daemon=True)
+            _worker.start()
+
+def _exhausted(budget: Dict[str, float]) -> bool:
+    return budget["blocks"] >= MAX_BLOCKS_PER_SESSION or budget["seconds"] >= MAX_SECONDS_PER_SESSION
+
+def _next_batch():
+    """
+    Round-robin over sessions with budget left: the queued blocks of the next page
+    (up to the session's remaining block budget). Blocks until there is work.
+    """
+    with _cond:
+        while True:
+            for session_id in list(_queues):
+                queue = _queues[session_id]
+                budget = _budgets.get(session_id)
+                if not queue or budget is None or _exhausted(budget):
+                    del _queues[session_id]
+                    continue
+                _queues.move_to_end(session_id)  # next call serves another session first
+                image_path = queue[0][0]
+                bboxes = []
+                while queue and queue[0][0] == image_path and len(bboxes) < MAX_BLOCKS_PER_SESSION - budget["blocks"]:
+                    bboxes.append(queue.popleft()[1])
+                if not queue:
+                    del _queues[session_id]
+                return session_id, image_path, bboxes
+            _cond.wait()
+
+def _run():
+    while True:
+        session_id, image_path, bboxes = _next_batch()
+        editor_engine.wait_until_idle()
+        try:
+            img = editor_engine.load_inpaint_source(image_path)  # decoded once for the whole page
+        except Exception as e:
+            logger.warning(f"Pre-inpainting {image_path} failed: {e}")
+            img = None
+        if img is None:
+            with _cond:
+                _stats["skipped"] += len(bboxes)
+            continue
+
+        for n, bbox in enumerate(bboxes):
+            editor_engine.wait_until_idle()
+            start = time.perf_counter()
+            try:
+                computed = editor_engine.precompute_patch(image_path, bbox, DEFAULT_FILL_SIZE, img=img)
+            except Exception as e:
+                logger.warning(f"Pre-inpainting {bbox} of {image_path} failed: {e}")
+                computed = False
+            elapsed = time.perf_counter() - start
+
+            with _cond:
+                _stats["computed" if computed else "skipped"] += 1
+                budget = _budgets.get(session_id)
+                if budget is None:  # evicted meanwhile
+                    break
+                if computed:
+                    budget["blocks"] += 1
+                    budget["seconds"] += elapsed
+                if _exhausted(budget):
+                    _stats["skipped"] += len(bboxes) - n - 1
+                    break
@@ -1,11 +1,21 @@
 import os
+import shutil
+import threading
 from PIL import Image
-from typing import List
+from typing import List, Optional
+
+from execution import coords
 
 def process_single_image(file_path: str, output_dir: str) -> List[str]:
     """
     Process a single image file (PNG/JPG) as a one-page document.
-    Converts the image to 'page_0.png' in the output directory.
+    Provides 'page_0.png' in the output directory.
+
+    PNG inputs in an editable mode are copied byte-for-byte (no decode / re-encode).
+    Other inputs (JPEG) stay encoded: the input file is recorded as the page source
+    and page_0.png is only decoded on first use (ensure_page_image), so viewing and
+    unmodified exports never pay for a PNG copy of a photo.
+    The original input file is kept so unmodified exports can return it unchanged.
     
     Args:
         file_path: Path to the input image.
@@ -16,15 +26,70 @@ def process_single_image(file_path: str, output_dir: str) -> List[str]:
     """
     os.makedirs(output_dir, exist_ok=True)
     
-    # We enforce conversion to PNG for internal consistency with the editor pipeline
+    # We enforce PNG for internal consistency with the editor pipeline
     # (server.py assumes .png for pages)
     target_filename = "page_0.png"
     target_path = os.path.join(output_dir, target_filename)
     
+    # Image.open only reads the header; pixels are decoded on demand
     with Image.open(file_path) as img:
-        # Ensure RGB if saving as PNG/JPG to avoid mode issues (e.g. CMYK)
+        geom = coords.image_geometry(0, img.width, img.height)
+
+        if img.format == "PNG" and img.mode not in ('CMYK', 'P'):
+            # Already a PNG the editor can use: pass the encoded bytes through
+            coords.save_geometry(output_dir, [geom])
+            shutil.copyfile(file_path, target_path)
+            return [target_filename]
+
+        if img.format == "PNG":
+            # Palette / CMYK PNG: convert now (cheap, and keeps the page a PNG)
+            coords.save_geometry(output_dir, [geom])
+            _decode_to_png(file_path, target_path)
+            return [target_filename]
+
+    # Keep the encoded input as the page; decoded lazily by ensure_page_image
+    geom["source"] = {"type": "input_image", "file": os.path.basename(file_path)}
+    coords.save_geometry(output_dir, [geom])
+    return [target_filename]
+
+def _decode_to_png(source_path: str, target_path: str):
+    """Decode any image to an RGB(A) PNG (temp file + rename; safe if two threads race)."""
+    tmp_path = f"{target_path}.{os.getpid()}.{threading.get_ident()}.tmp"
+    with Image.open(source_path) as img:
+        # Ensure RGB if saving as PNG to avoid mode issues (e.g. CMYK)
         if img.mode in ('CMYK', 'P'):
             img = img.convert('RGB')
-        img.save(target_path, "PNG")
-    
-    return [target_filename]
+        img.save(tmp_path, "PNG")
+    os.replace(tmp_path, target_path)
+
+def _page_source(session_dir: str, page_index: int) -> Optional[str]:
+    """The still-encoded input image standing in for page_{page_index}.png, if any."""
+    geom = coords.get_page_geometry(session_dir, page_index)
+    source = (geom or {}).get("source") or {}
+    if source.get("type") != "input_image":
+        return None
+    path = os.path.join(session_dir, source["file"])
+    return path if os.path.exists(path) else None
+
+def ensure_page_image(session_dir: str, page_index: int) -> str:
+    """
+    Path of page_{page_index}.png, decoding it from the input image first if it was
+    kept encoded at upload. Call before OCR or editing the page.
+    """
+    image_path = os.path.join(session_dir, f"page_{page_index}.png")
+    if not os.path.exists(image_path):
+        source = _page_source(session_dir, page_index)
+        if source is not None:
+            _decode_to_png(source, image_path)
+    return image_path
+
+def display_path(session_dir: str, filename: str) -> str:
+    """File to show for a page image: page_N.png, or its encoded source until it is decoded."""
+    image_path = os.path.join(session_dir, filename)
+    if not os.path.exists(image_path):
+        name = os.path.splitext(filename)[0]
+        if name.startswith("page_") and name[5:].isdigit():
+            source = _page_source(session_dir, int(name[5:]))
+            if source is not None:
+                return source
+    return image_path
@@ -1,17 +1,185 @@
 import fitz  # PyMuPDF
+import math
 import os
 import logging
-from typing import List
+import time
+from typing import List, Callable, Optional, Dict, Any
+
+from execution import coords
 
 logger = logging.getLogger(__name__)
 
-def convert_pdf_to_images(pdf_path: str, output_dir: str) -> List[str]:
+# Adaptive render DPI
+RENDER_DPI = 200            # Default for normal slides
+MIN_DPI = 72
+MAX_DPI = 400
+MAX_PAGE_PIXELS = 16_000_000  # Pixel budget per page (~48 MB RGB), bounds OCR / LaMa memory
+MIN_TEXT_PX = 24            # Smallest text should be at least this many pixels tall
+MIN_TEXT_PT = 3.0           # Ignore smaller (hidden / decorative) text when estimating
+GEOMETRY_SAVE_EVERY = 16    # Rewrite pages.json after this many newly rendered pages...
+GEOMETRY_SAVE_INTERVAL = 5.0  # ...or this many seconds (resume re-renders unsaved pages)
+
+# Image-only pages (e.g. exported slide decks): use the embedded image at native resolution
+EMBEDDED_IMAGE_FAST_PATH = True
+COVER_TOLERANCE_PT = 2.0    # Max distance between the image's edges and the page's
+# Drawing operations that would be visible on top of the image (see Page.get_bboxlog)
+_VISIBLE_OPS = ("fill-text", "stroke-text", "fill-path", "stroke-path", "fill-image", "fill-imgmask", "fill-shade")
+
+def estimate_min_text_height(page: "fitz.Page") -> Optional[float]:
+    """Smallest font size (pt) of visible text on the page, or None for image-only pages."""
+    sizes = []
+    for block in page.get_text("dict").get("blocks", []):
+        for line in block.get("lines", []):
+            for span in line.get("spans", []):
+                if span.get("text", "").strip() and span.get("size", 0) >= MIN_TEXT_PT:
+                    sizes.append(span["size"])
+    return min(sizes) if sizes else None
+
+def choose_dpi(page: "fitz.Page") -> float:
+    """
+    Pick the render DPI for a page:
+    enough for its smallest text to reach MIN_TEXT_PX (at least RENDER_DPI),
+    capped so the raster stays within MAX_PAGE_PIXELS.
+    """
+    dpi = float(RENDER_DPI)
+    min_text_pt = estimate_min_text_height(page)
+    if min_text_pt:
+        dpi = max(dpi, 72.0 * MIN_TEXT_PX / min_text_pt)
+    dpi = min(max(dpi, MIN_DPI), MAX_DPI)
+
+    rect = page.rect
+    area_in2 = (rect.width / 72.0) * (rect.height / 72.0)
+    if area_in2 > 0:
+        budget_dpi = math.sqrt(MAX_PAGE_PIXELS / area_in2)
+        dpi = min(dpi, budget_dpi)
+    return round(dpi, 2)
+
+def find_page_image(doc: "fitz.Document", page: "fitz.Page") -> Optional[Dict[str, Any]]:
+    """
+    If the page is a single upright, opaque image covering the whole page with nothing
+    visible drawn over it, return {xref, bbox, transform}; else None.
+    Content drawn before the image (hidden beneath it) and invisible text are ignored.
+    """
+    if page.rotation:
+        return None
+    images = page.get_images(full=True)
+    if len(images) != 1:
+        return None
+    xref, smask = images[0][0], images[0][1]
+    if smask or doc.xref_get_key(xref, "Mask")[0] != "null":
+        return None
+
+    infos = page.get_image_info(xrefs=True)
+    if len(infos) != 1:
+        return None
+    a, b, c, d, _, _ = infos[0]["transform"]
+    if abs(b) > 1e-6 or abs(c) > 1e-6 or a <= 0 or d <= 0:
+        return None  # rotated or flipped
+    bbox = fitz.Rect(infos[0]["bbox"])
+    if any(abs(u - v) > COVER_TOLERANCE_PT for u, v in zip(bbox, page.rect)):
+        return None
+
+    # Nothing visible after the image
+    ops = [op for op, _ in page.get_bboxlog()]
+    if ops.count("fill-image") != 1:
+        return None
+    after = ops[ops.index("fill-image") + 1:]
+    if any(op in _VISIBLE_OPS for op in after):
+        return None
+
+    return {"xref": xref, "bbox": list(bbox), "transform": list(infos[0]["transform"])}
+
+def extract_page_image(doc: "fitz.Document", page_index: int, output_dir: str) -> Optional[Dict[str, Any]]:
+    """
+    Fast path for image-only pages: write the embedded image at its native resolution to
+    'page_{page_index}.png' (no rasterization or resampling).
+    Returns the page geometry (with 'source' describing the image), or None if the page
+    does not qualify or its native resolution is outside MIN_DPI / MAX_PAGE_PIXELS.
+    """
+    page = doc.load_page(page_index)
+    found = find_page_image(doc, page)
+    if found is None:
+        return None
+
+    xref = found["xref"]
+    extracted = doc.extract_image(xref)
+    width, height = extracted["width"], extracted["height"]
+    x0, y0, x1, y1 = found["bbox"]
+    dpi = round(72.0 * width / (x1 - x0), 2)
+    if dpi < MIN_DPI or width * height > MAX_PAGE_PIXELS:
+        return None
+
+    image_filename = f"page_{page_index}.png"
+    image_path = os.path.join(output_dir, image_filename)
+    tmp_path = image_path + ".tmp"
+    if extracted["ext"] == "png" and extracted.get("colorspace") in (1, 3):
+        with open(tmp_path, "wb") as f:
+            f.write(extracted["image"])
+    else:
+        # e.g. JPEG / CMYK: decode at native size and store as PNG
+        pix = fitz.Pixmap(doc, xref)
+        if pix.colorspace and pix.colorspace.n not in (1, 3):
+            pix = fitz.Pixmap(fitz.csRGB, pix)
+        if pix.alpha:
+            pix = fitz.Pixmap(pix, 0)
+        pix.save(tmp_path, output="png")
+    os.replace(tmp_path, image_path)
+
+    geom = coords.make_geometry(page_index, page.rect.width, page.rect.height, width, height, dpi,
+                                image_rect=found["bbox"])
+    geom["image"] = image_filename
+    geom["source"] = {"type": "embedded_image", "xref": xref, "ext": extracted["ext"],
+                      "transform": found["transform"]}
+    return geom
+
+def render_page(doc: "fitz.Document", page_index: int, output_dir: str, dpi: Optional[float] = None) -> Dict[str, Any]:
+    """
+    Render a single page of an open document to 'page_{page_index}.png' in output_dir.
+    If dpi is None it is chosen per page by choose_dpi(), and image-only pages use
+    their embedded image instead (extract_page_image).
+    
+    Returns:
+        Page geometry (see execution.coords) plus 'image': the generated filename.
+    """
+    if dpi is None and EMBEDDED_IMAGE_FAST_PATH:
+        try:
+            geom = extract_page_image(doc, page_index, output_dir)
+        except Exception as e:
+            logger.warning(f"Embedded image extraction failed on page {page_index}, rendering instead: {e}")
+            geom = None
+        if geom is not None:
+            return geom
+
+    page = doc.load_page(page_index)
+    if dpi is None:
+        dpi = choose_dpi(page)
+    zoom = dpi / 72.0
+    pix = page.get_pixmap(matrix=fitz.Matrix(zoom, zoom)) # render page to an image
+    
+    image_filename = f"page_{page_index}.png"
+    image_path = os.path.join(output_dir, image_filename)
+    # Write to a temp file first so an existing page_N.png is always complete (resumable jobs)
+    tmp_path = image_path + ".tmp"
+    pix.save(tmp_path, output="png")
+    os.replace(tmp_path, image_path)
+
+    geom = coords.make_geometry(page_index, page.rect.width, page.rect.height, pix.width, pix.height, dpi)
+    geom["image"] = image_filename
+    return geom
+
+def convert_pdf_to_images(pdf_path: str, output_dir: str,
+                          progress: Optional[Callable[[int, int], None]] = None,
+                          check_cancelled: Optional[Callable[[], None]] = None,
+                          resume: bool = False) -> List[str]:
     """
     Convert a PDF file to a list of images (one per page) using PyMuPDF.
     
     Args:
         pdf_path: Absolute path to the PDF file.
         output_dir: Directory to save the images.
+        progress: Optional callback(completed, total) called after each page.
+        check_cancelled: Optional callback that raises to abort between pages.
+        resume: Skip pages whose image already exists (interrupted background job).
         
     Returns:
         List of filenames of the generated images.
@@ -25,16 +193,34 @@ def convert_pdf_to_images(pdf_path: str, output_dir: str) -> List[str]:
         doc = fitz.open(pdf_path)
         image_paths = []
 
-        for i in range(len(doc)):
-            page = doc.load_page(i)  # number of page
-            pix = page.get_pixmap(dpi=200) # render page to an image
-            
-            image_filename = f"page_{i}.png"
-            image_path = os.path.join(output_dir, image_filename)
-            
-            pix.save(image_path)
-            image_paths.append(image_filename)
-            
+        # Per-page geometry (DPI / scale) recorded in the session's pages.json
+        geometries = {g["index"]: g for g in coords.load_geometry(output_dir)} if resume else {}
+
+        def save():
+            coords.save_geometry(output_dir, [geometries[k] for k in sorted(geometries)])
+
+        # pages.json holds every page, so rewriting it per page is O(n^2): batch the saves
+        total = len(doc)
+        unsaved, last_save = 0, time.monotonic()
+        try:
+            for i in range(total):
+                if check_cancelled:
+                    check_cancelled()
+                image_filename = f"page_{i}.png"
+                if not (resume and i in geometries and os.path.exists(os.path.join(output_dir, image_filename))):
+                    geometries[i] = render_page(doc, i, output_dir)
+                    unsaved += 1
+                    if unsaved >= GEOMETRY_SAVE_EVERY or time.monotonic() - last_save >= GEOMETRY_SAVE_INTERVAL:
+                        save()
+                        unsaved, last_save = 0, time.monotonic()
+                image_paths.append(image_filename)
+                if progress:
+                    progress(i + 1, total)
+        finally:
+            # Also on cancellation / errors, so a resumed job keeps the rendered pages
+            if unsaved:
+                save()
+
         doc.close()
         logger.info(f"Generated {len(image_paths)} images.")
         return image_paths
@@ -0,0 +1,200 @@
+"""
+Per-session inverted index over OCR blocks, for deck-wide search and replace.
+
+Block text is normalized like block_store.normalize_text (NFKC, case-folded, whitespace
+collapsed) and split into terms:
+    - words:      runs of non-CJK word characters ("w:typo")
+    - CJK n-grams: every character and every bigram of CJK runs ("c:簡", "c:簡報"),
+                  since CJK text has no word boundaries
+
+A query is split the same way; candidate blocks contain all of its terms (words at the
+edges of the query may be partial, so they match any indexed word containing them),
+then each candidate is checked for the normalized query as a substring.
+
+Indexes live in memory and are updated page by page as /analyze stores blocks; after a
+restart, a session's index is rebuilt from its blocks_N.json files on first use.
+"""
+import re
+import threading
+import unicodedata
+from collections import OrderedDict, defaultdict
+from typing import Any, Dict, Iterable, List, Optional, Set, Tuple
+
+from execution import block_store
+
+CJK_CHARS = "\u3040-\u30ff\u3100-\u312f\u3400-\u4dbf\u4e00-\u9fff\uac00-\ud7af\uf900-\ufaff"  # kana, bopomofo, CJK, hangul
+TOKEN_PATTERN = re.compile(rf"(?P<cjk>[{CJK_CHARS}]+)|(?P<word>[^\W{CJK_CHARS}]+)")
+
+MAX_SESSIONS = 64  # indexes kept in memory (least recently used are dropped, rebuilt on demand)
+
+BlockKey = Tuple[int, int]  # (page_index, block_id)
+
+def _tokens(norm: str) -> List[Tuple[str, str]]:
+    """(kind, token) pairs of normalized text, kind 'cjk' or 'word'."""
+    return [(m.lastgroup, m.group()) for m in TOKEN_PATTERN.finditer(norm)]
+
+def _terms(norm: str) -> Set[str]:
+    terms = set()
+    for kind, token in _tokens(norm):
+        if kind == "word":
+            terms.add("w:" + token)
+        else:
+            terms.update("c:" + ch for ch in token)
+            terms.update("c:" + token[i:i + 2] for i in range(len(token) - 1))
+    return terms
+
+class TextIndex:
+    def __init__(self):
+        self.blocks: Dict[BlockKey, Dict[str, Any]] = {}
+        self.postings: Dict[str, Set[BlockKey]] = defaultdict(set)
+        self.pages: Dict[int, List[BlockKey]] = {}
+
+    def update_page(self, page_index: int, blocks: List[Dict[str, Any]]):
+        """Replace the page's blocks in the index."""
+        for key in self.pages.pop(page_index, []):
+            for term in _terms(self.blocks.pop(key)["norm"]):
+                posting = self.postings.get(term)
+                if posting is not None:
+                    posting.discard(key)
+                    if not posting:
+                        del self.postings[term]
+
+        keys = []
+        for block in blocks:
+            key = (page_index, block["id"])
+            norm = block_store.normalize_text(block["text"])
+            self.blocks[key] = {"text": block["text"], "norm": norm, "bbox": block["bbox"]}
+            for term in _terms(norm):
+                self.postings[term].add(key)
+            keys.append(key)
+        self.pages[page_index] = keys
+
+    def _word_candidates(self, token: str, first: bool, last: bool) -> Set[BlockKey]:
+        if not first and not last:
+            return set(self.postings.get("w:" + token, ()))
+        # Edge words of the query may be cut: match indexed words ending / starting / containing it
+        if first and last:
+            match = lambda w: token in w
+        elif first:
+            match = lambda w: w.endswith(token)
+        else:
+            match = lambda w: w.startswith(token)
+        found: Set[BlockKey] = set()
+        for term, keys in self.postings.items():
+            if term.startswith("w:") and match(term[2:]):
+                found |= keys
+        return found
+
+    def _candidates(self, norm_query: str) -> Iterable[BlockKey]:
+        tokens = _tokens(norm_query)
+        if not tokens:
+            return list(self.blocks)
+        # A token touches an edge if nothing but non-token characters surround it in the query
+        spans = [m.span() for m in TOKEN_PATTERN.finditer(norm_query)]
+        candidates: Optional[Set[BlockKey]] = None
+        for n, ((kind, token), (start, end)) in enumerate(zip(tokens, spans)):
+            if kind == "word":
+                keys = self._word_candidates(token, first=(n == 0 and start == 0),
+                                             last=(n == len(tokens) - 1 and end == len(norm_query)))
+            else:
+                grams = [token] if len(token) == 1 else [token[i:i + 2] for i in range(len(token) - 1)]
+                keys = set.intersection(*[self.postings.get("c:" + g, set()) for g in grams])
+            candidates = keys if candidates is None else candidates & keys
+            if not candidates:
+                return []
+        return candidates
+
+    def search(self, query: str, pages: Optional[List[int]] = None,
+               limit: Optional[int] = None) -> List[Dict[str, Any]]:
+        """Blocks whose normalized text contains the normalized query, in page / block order."""
+        norm_query = block_store.normalize_text(query)
+        if not norm_query:
+            return []
+        page_filter = set(pages) if pages is not None else None
+        matches = []
+        for key in sorted(self._candidates(norm_query)):
+            if page_filter is not None and key[0] not in page_filter:
+                continue
+            block = self.blocks[key]
+            if norm_query in block["norm"]:
+                matches.append({"page_index": key[0], "block_id": key[1],
+                                "text": block["text"], "bbox": block["bbox"]})
+                if limit is not None and len(matches) >= limit:
+                    break
+        return matches
+
+_indexes: "OrderedDict[str, TextIndex]" = OrderedDict()
+_lock = threading.RLock()
+
+def get_index(session_dir: str) -> TextIndex:
+    """The session's index, rebuilt from its stored blocks if not in memory."""
+    with _lock:
+        index = _indexes.get(session_dir)
+        if index is None:
+            index = TextIndex()
+            for page_index, blocks in block_store.load_all_blocks(session_dir).items():
+                index.update_page(page_index, blocks or [])
+            _indexes[session_dir] = index
+            while len(_indexes) > MAX_SESSIONS:
+                _indexes.popitem(last=False)
+        _indexes.move_to_end(session_dir)
+        return index
+
+def update_page(session_dir: str, page_index: int, blocks: List[Dict[str, Any]]):
+    """Index (or re-index) one analyzed page."""
+    with _lock:
+        get_index(session_dir).update_page(page_index, blocks)
+
+def search(session_dir: str, query: str, pages: Optional[List[int]] = None,
+           limit: Optional[int] = None) -> List[Dict[str, Any]]:
+    with _lock:
+        return get_index(session_dir).search(query, pages, limit)
+
+def analyzed_pages(session_dir: str) -> List[int]:
+    with _lock:
+        return sorted(get_index(session_dir).pages)
+
+def _normalize_with_offsets(text: str) -> Tuple[str, List[Tuple[int, int]]]:
+    """
+    NFKC + case-folded text, and for each of its characters the (start, end) span of the
+    original characters it came from. A base character and its combining marks are
+    normalized together, so composed / decomposed forms match alike.
+    """
+    pieces: List[str] = []
+    origin: List[Tuple[int, int]] = []
+    i = 0
+    while i < len(text):
+        j = i + 1
+        while j < len(text) and unicodedata.combining(text[j]):
+            j += 1
+        piece = unicodedata.normalize("NFKC", text[i:j]).casefold()
+        pieces.append(piece)
+        origin.extend([(i, j)] * len(piece))
+        i = j
+    return "".join(pieces), origin
+
+def replace_text(text: str, find: str, replacement: str) -> Optional[str]:
+    """
+    Replace every occurrence of find in text, matching like search (NFKC, case-insensitive,
+    any whitespace run matches a space). Matches are found in the normalized text but spliced
+    into the original, so characters outside them are kept as they were (e.g. full-width
+    punctuation). Returns None if find does not occur.
+    """
+    parts = block_store.normalize_text(find).split(" ")
+    if not parts or not parts[0]:
+        return None
+    pattern = re.compile(r"\s+".join(re.escape(p) for p in parts), re.IGNORECASE)
+    normalized, origin = _normalize_with_offsets(text)
+
+    out: List[str] = []
+    pos = 0
+    for m in pattern.finditer(normalized):
+        start, end = origin[m.start()][0], origin[m.end() - 1][1]
+        if start < pos:  # shares an original character with the previous match
+            continue
+        out += [text[pos:start], replacement]
+        pos = end
+    if not out:
+        return None
+    out.append(text[pos:])
+    return "".join(out)
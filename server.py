@@ -1,17 +1,25 @@
 import os
 import uuid
+import json
+import time
 import shutil
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import asynccontextmanager
 from datetime import datetime
 
 from typing import List, Optional, Dict, Any, Union
-from fastapi import FastAPI, UploadFile, File, HTTPException, Body
+from fastapi import FastAPI, UploadFile, File, HTTPException, Body, Header
 from fastapi.staticfiles import StaticFiles
-from fastapi.responses import FileResponse, JSONResponse
+from fastapi.responses import FileResponse, JSONResponse, StreamingResponse, RedirectResponse, Response
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.concurrency import run_in_threadpool
 from pydantic import BaseModel
 
-# Import execution modules
-from execution import process_pdf, ocr_engine, generate_pdf, editor_engine
+# Import execution modules (cpu_scheduler first: it caps thread pools before numpy/torch/paddle load)
+from execution import cpu_scheduler
+from execution import process_pdf, ocr_engine, generate_pdf, editor_engine, job_queue, coords, font_registry, block_store, pre_inpaint, page_versions, text_index, process_image
+from execution.page_queue import PageUpdateQueue
 
 import logging
 
@@ -42,7 +50,20 @@ logger.info("Server is starting up... Logging configured.")
 
 
 
-app = FastAPI(title="PDFTextEdit")
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Resume unfinished background jobs (jobs / handlers are registered below)
+    jobs.start()
+    # OpenCV's pool is process-wide, shared by OCR and inpainting: sized once to the CPU budget
+    cpu_scheduler.configure_opencv()
+    # Build (if fonts changed) and memory-map the glyph coverage / advance index
+    try:
+        font_registry.load_registry()
+    except Exception as e:
+        logger.error(f"Font registry unavailable: {e}")
+    yield
+
+app = FastAPI(title="PDFTextEdit", lifespan=lifespan)
 
 
 # CORS
@@ -59,6 +80,19 @@ TMP_DIR = ".tmp"
 STATIC_DIR = "static"
 os.makedirs(TMP_DIR, exist_ok=True)
 
+# Worker pool for rebuilding independent pages concurrently (/update-pages)
+PAGE_WORKERS = min(4, os.cpu_count() or 1)
+page_executor = ThreadPoolExecutor(max_workers=PAGE_WORKERS, thread_name_prefix="page")
+# One rebuild per page at a time; overlapping requests for a page coalesce (latest wins)
+page_updates = PageUpdateQueue(page_executor)
+
+# Background jobs (long uploads / exports), persisted under .tmp/jobs
+jobs = job_queue.JobQueue(job_queue.JobStore(os.path.join(TMP_DIR, "jobs")))
+
+# Inpaint analyzed blocks with LaMa in the background so first edits hit the patch cache.
+# Opt-in (PRE_INPAINT=1): it spends CPU on blocks that may never be edited.
+PRE_INPAINT_ENABLED = os.environ.get("PRE_INPAINT", "0") != "0"
+
 # Mount Static
 app.mount("/static", StaticFiles(directory=STATIC_DIR), name="static")
 
@@ -84,30 +118,40 @@ async def upload_file_endpoint(file: UploadFile = File(...)):
     try:
         with open(input_path, "wb") as buffer:
             shutil.copyfileobj(file.file, buffer)
-            
-        if ext == ".pdf":
-            pages = process_pdf.convert_pdf_to_images(input_path, session_dir)
-        else:
-            # Image Flow
-            # For images, we just copy 'input.ext' to 'page_0.png' (standardize on png for internal editing? or keep original?)
-            # editor_engine expects 'page_{i}.png'.
-            # process_image module handles this.
-            from execution import process_image
-            pages = process_image.process_single_image(input_path, session_dir)
+
+        # Blocking work runs off the event loop so concurrent requests are not serialized
+        pages = await run_in_threadpool(convert_input, session_dir, ext)
         
         return {
             "session_id": session_id,
             "pages": pages,
+            "page_urls": [page_versions.page_url(session_id, session_dir, p) for p in pages],
             "message": "Upload successful"
         }
     except Exception as e:
         logger.error(f"Error in upload: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+def convert_input(session_dir: str, ext: str, progress=None, check_cancelled=None, resume: bool = False) -> List[str]:
+    """Turn the saved input{ext} into page_N.png images. Returns the page filenames."""
+    input_path = os.path.join(session_dir, f"input{ext}")
+    if ext == ".pdf":
+        return process_pdf.convert_pdf_to_images(input_path, session_dir, progress=progress,
+                                                 check_cancelled=check_cancelled, resume=resume)
+
+    # Image Flow
+    # For images, we just copy 'input.ext' to 'page_0.png' (standardize on png for internal editing? or keep original?)
+    # editor_engine expects 'page_{i}.png'.
+    # process_image module handles this (JPEGs are decoded lazily, see ensure_page_image).
+    pages = process_image.process_single_image(input_path, session_dir)
+    if progress:
+        progress(1, 1)
+    return pages
 
 class AnalyzeRequest(BaseModel):
     session_id: str
     page_index: int
+    engine: str = "paddle"
 
 @app.post("/analyze")
 async def analyze_page(request: AnalyzeRequest):
@@ -115,18 +159,35 @@ async def analyze_page(request: AnalyzeRequest):
     if not os.path.exists(session_dir):
         raise HTTPException(status_code=404, detail="Session not found")
         
+    # OCR blocks; run off the event loop so concurrent requests are not serialized
+    blocks = await run_in_threadpool(_analyze_page, request.session_id, session_dir, request.page_index, request.engine)
+
+    # Also report each block in PDF points when the page geometry is known
+    geom = coords.get_page_geometry(session_dir, request.page_index)
+    if geom:
+        for block in blocks:
+            block["bbox_pt"] = [round(v, 2) for v in coords.px_to_pt(block["bbox"], geom)]
+    
+    return {"blocks": blocks, "geometry": geom}
+
+def _analyze_page(session_id: str, session_dir: str, page_index: int, engine: str) -> List[Dict[str, Any]]:
     # Call execution.ocr_engine.analyze_image
     # We need to reconstruct the image filename. 
     # Assumption: process_pdf returns 'page_N.png' where N is index?
     # process_pdf logic: f"page_{i}.png", i starts at 0.
-    image_path = os.path.join(session_dir, f"page_{request.page_index}.png")
+    # (JPEG uploads are decoded to page_0.png here, on first use)
+    image_path = process_image.ensure_page_image(session_dir, page_index)
     
     if not os.path.exists(image_path):
-        raise HTTPException(status_code=404, detail=f"Image for page {request.page_index} not found")
+        raise HTTPException(status_code=404, detail=f"Image for page {page_index} not found")
 
-    blocks = ocr_engine.analyze_image(image_path)
-    
-    return {"blocks": blocks}
+    blocks = ocr_engine.analyze_image(image_path, engine=engine)
+    # Kept per session for cross-page features (repeated elements)
+    block_store.save_page_blocks(session_dir, page_index, blocks)
+    text_index.update_page(session_dir, page_index, blocks)
+    if PRE_INPAINT_ENABLED:
+        pre_inpaint.enqueue(session_id, image_path, blocks)
+    return blocks
 
 class TextModification(BaseModel):
     bbox: List[float] # [x, y, w, h]
@@ -137,6 +198,7 @@ class TextModification(BaseModel):
 class GenerateRequest(BaseModel):
     session_id: str
     modifications: List[TextModification]
+    compression: str = "image" # PDF output: 'image' or 'mrc' (text mask over a downsampled background)
 
 @app.post("/generate")
 async def generate_pdf_endpoint(request: GenerateRequest):
@@ -144,6 +206,16 @@ async def generate_pdf_endpoint(request: GenerateRequest):
     if not os.path.exists(session_dir):
         raise HTTPException(status_code=404, detail="Session not found")
         
+    if request.compression not in generate_pdf.COMPRESSIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown compression '{request.compression}'")
+    output_path = await run_in_threadpool(build_output, session_dir, request.modifications,
+                                          compression=request.compression)
+    
+    return {"download_url": f"/download/{request.session_id}/{output_path}"}
+
+def build_output(session_dir: str, modifications: list, progress=None, check_cancelled=None,
+                 compression: str = "image") -> str:
+    """Export the session as PDF or image (matching the input type). Returns the output filename."""
     # Determine Output Format based on input existence
     # We look for input.pdf, input.png, input.jpg, input.jpeg
     
@@ -151,19 +223,21 @@ async def generate_pdf_endpoint(request: GenerateRequest):
     
     if os.path.exists(input_pdf):
         # Call execution.generate_pdf.create_pdf
-        output_path = generate_pdf.create_pdf(session_dir, request.modifications)
-    else:
-        # Image Mode
-        # Detect extension
-        ext = ".png" # default
-        for e in [".png", ".jpg", ".jpeg"]:
-             if os.path.exists(os.path.join(session_dir, f"input{e}")):
-                 ext = e
-                 break
-        
-        output_path = generate_pdf.create_image(session_dir, ext)
+        return generate_pdf.create_pdf(session_dir, modifications, progress=progress,
+                                       check_cancelled=check_cancelled, compression=compression)
+
+    # Image Mode
+    # Detect extension
+    ext = ".png" # default
+    for e in [".png", ".jpg", ".jpeg"]:
+         if os.path.exists(os.path.join(session_dir, f"input{e}")):
+             ext = e
+             break
     
-    return {"download_url": f"/download/{request.session_id}/{output_path}"}
+    output_path = generate_pdf.create_image(session_dir, ext)
+    if progress:
+        progress(1, 1)
+    return output_path
 
 class EditSpec(BaseModel):
     bbox: List[float] # [x, y, w, h]
@@ -178,50 +252,272 @@ class EditSpec(BaseModel):
     offset_x: int = 0
     offset_y: int = 0
     fill_size: Optional[Union[str, float, int]] = "100%"
+    units: str = "px" # bbox units: 'px' (page image), 'pt' (PDF points) or 'preview'
+    preview_width: Optional[float] = None # displayed image width, for units='preview'
 
 class UpdatePageRequest(BaseModel):
     session_id: str
     page_index: int
     edits: List[EditSpec]
 
+def rebuild_page(session_id: str, page_index: int, edits: List[EditSpec]) -> str:
+    """
+    Restore page_{page_index}.png from its original and replay all edits in order.
+    Returns the page image URL.
+    """
+    session_dir = os.path.join(TMP_DIR, session_id)
+    image_path = process_image.ensure_page_image(session_dir, page_index)
+    if not os.path.exists(image_path):
+        raise HTTPException(status_code=404, detail=f"Image for page {page_index} not found")
+
+    geom = coords.get_page_geometry(session_dir, page_index)
+    try:
+        bboxes = [coords.to_px(edit.bbox, geom, edit.units, edit.preview_width) for edit in edits]
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+    # 1. Restore Original
+    editor_engine.restore_page(image_path)
+    
+    # 2. Apply All Edits
+    for edit, bbox in zip(edits, bboxes):
+        editor_engine.apply_edit(
+            image_path, 
+            bbox, 
+            edit.text, 
+            font_family=edit.font_family,
+            font_size=edit.font_size,
+            text_color=edit.text_color,
+            is_bold=edit.is_bold,
+            is_italic=edit.is_italic,
+            inpaint_method=edit.inpaint_method,
+            fill_color=edit.fill_color,
+            offset_x=edit.offset_x,
+            offset_y=edit.offset_y,
+            fill_size=edit.fill_size,
+            restore_first=False
+        )
+
+    return page_versions.page_url(session_id, session_dir, f"page_{page_index}.png")
+
+async def queue_rebuild(session_id: str, page_index: int, edits: List[EditSpec]) -> Dict[str, Any]:
+    """
+    Rebuild a page through page_updates: serialized per page, and if newer edits for the
+    page arrive while it is busy, only the latest list is applied. Superseded callers get
+    {"status": "superseded", "superseded_by", "image_url"} pointing to the final result.
+    """
+    def run():
+        return {"status": "success", "image_url": rebuild_page(session_id, page_index, edits)}
+    return await page_updates.submit((session_id, page_index), run)
+
 @app.post("/update-page")
 async def update_page(request: UpdatePageRequest):
     try:
         session_dir = os.path.join(TMP_DIR, request.session_id)
         if not os.path.exists(session_dir):
             raise HTTPException(status_code=404, detail="Session not found")
-            
-        image_path = os.path.join(session_dir, f"page_{request.page_index}.png")
-        if not os.path.exists(image_path):
-            raise HTTPException(status_code=404, detail="Page image not found")
 
-        # 1. Restore Original
-        editor_engine.restore_page(image_path)
-        
-        # 2. Apply All Edits
-        for edit in request.edits:
-            editor_engine.apply_edit(
-                image_path, 
-                edit.bbox, 
-                edit.text, 
-                font_family=edit.font_family,
-                font_size=edit.font_size,
-                text_color=edit.text_color,
-                is_bold=edit.is_bold,
-                is_italic=edit.is_italic,
-                inpaint_method=edit.inpaint_method,
-                fill_color=edit.fill_color,
-                offset_x=edit.offset_x,
-                offset_y=edit.offset_y,
-                fill_size=edit.fill_size,
-                restore_first=False
-            )
-        
-        return {"status": "success", "image_url": f"/tmp/{request.session_id}/page_{request.page_index}.png"}
+        return await queue_rebuild(request.session_id, request.page_index, request.edits)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error updating page: {e}")
         raise HTTPException(status_code=500, detail=str(e))
 
+class PageEdits(BaseModel):
+    page_index: int
+    edits: List[EditSpec]
+
+class UpdatePagesRequest(BaseModel):
+    session_id: str
+    pages: List[PageEdits]
+    stream: bool = False
+
+async def _rebuild_page_timed(session_id: str, page: PageEdits) -> Dict[str, Any]:
+    start = time.perf_counter()
+    try:
+        result = dict(await queue_rebuild(session_id, page.page_index, page.edits), page_index=page.page_index)
+    except HTTPException as e:
+        result = {"page_index": page.page_index, "status": "error", "detail": e.detail}
+    except Exception as e:
+        logger.error(f"Error updating page {page.page_index}: {e}")
+        result = {"page_index": page.page_index, "status": "error", "detail": str(e)}
+    result["elapsed_ms"] = round((time.perf_counter() - start) * 1000, 1)
+    return result
+
+@app.post("/update-pages")
+async def update_pages(request: UpdatePagesRequest):
+    """
+    Rebuild many pages in one request. Each page's edits are replayed in order
+    (same as /update-page, incl. per-page serialization); different pages are rebuilt
+    concurrently on page_executor.
+    With stream=true, results are sent as NDJSON lines as pages finish.
+    """
+    session_dir = os.path.join(TMP_DIR, request.session_id)
+    if not os.path.exists(session_dir):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    page_indices = [p.page_index for p in request.pages]
+    if len(page_indices) != len(set(page_indices)):
+        raise HTTPException(status_code=400, detail="Each page_index may appear only once.")
+
+    start = time.perf_counter()
+    futures = [asyncio.ensure_future(_rebuild_page_timed(request.session_id, page))
+               for page in request.pages]
+
+    if request.stream:
+        async def result_stream():
+            for fut in asyncio.as_completed(futures):
+                result = await fut
+                yield json.dumps(result) + "\n"
+            total_ms = round((time.perf_counter() - start) * 1000, 1)
+            yield json.dumps({"status": "done", "elapsed_ms": total_ms}) + "\n"
+
+        return StreamingResponse(result_stream(), media_type="application/x-ndjson")
+
+    results = await asyncio.gather(*futures)
+    failed = sum(1 for r in results if r["status"] == "error")
+    return {
+        "status": "success" if failed == 0 else "partial",
+        "results": sorted(results, key=lambda r: r["page_index"]),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+class RepeatedElementsRequest(BaseModel):
+    session_id: str
+    min_pages: int = 2
+
+@app.post("/repeated-elements")
+async def repeated_elements(request: RepeatedElementsRequest):
+    """Text blocks repeated at the same position on several analyzed pages (footers, watermarks...)."""
+    session_dir = os.path.join(TMP_DIR, request.session_id)
+    if not os.path.exists(session_dir):
+        raise HTTPException(status_code=404, detail="Session not found")
+    return {"groups": block_store.find_repeated(session_dir, min_pages=request.min_pages)}
+
+class ApplyToAllRequest(BaseModel):
+    session_id: str
+    page_index: int
+    block_id: int
+    edit: EditSpec # bbox is replaced by each occurrence's bbox
+    page_edits: Dict[int, List[EditSpec]] = {} # Current edit list of each page (client state)
+
+@app.post("/apply-to-all")
+async def apply_to_all(request: ApplyToAllRequest):
+    """
+    Apply one edit to every occurrence of a repeated element and rebuild those pages
+    concurrently. Pages with an identical background around the element reuse the
+    same inpainted patch (editor_engine patch cache), so this costs about one inpaint.
+    """
+    session_dir = os.path.join(TMP_DIR, request.session_id)
+    if not os.path.exists(session_dir):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    occurrences = block_store.find_occurrences(session_dir, request.page_index, request.block_id)
+    if not occurrences:
+        raise HTTPException(status_code=404, detail="Block not found; analyze the page first")
+
+    pages = []
+    for occ in occurrences:
+        edit = request.edit.copy(update={"bbox": occ["bbox"], "units": "px"})
+        # Replace an earlier edit of the same block, keep the page's other edits in order
+        existing = [e for e in request.page_edits.get(occ["page_index"], []) if e.bbox != occ["bbox"]]
+        pages.append(PageEdits(page_index=occ["page_index"], edits=existing + [edit]))
+
+    start = time.perf_counter()
+    results = await asyncio.gather(*[_rebuild_page_timed(request.session_id, page) for page in pages])
+
+    return {
+        "occurrences": occurrences,
+        "results": sorted(results, key=lambda r: r["page_index"]),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
+class SearchRequest(BaseModel):
+    session_id: str
+    query: str
+    pages: Optional[List[int]] = None # restrict to these pages
+    limit: int = 500
+
+@app.post("/search")
+async def search_text(request: SearchRequest):
+    """Find OCR blocks containing the query on all analyzed pages (execution/text_index.py)."""
+    session_dir = os.path.join(TMP_DIR, request.session_id)
+    if not os.path.exists(session_dir):
+        raise HTTPException(status_code=404, detail="Session not found")
+    matches = text_index.search(session_dir, request.query, request.pages, request.limit)
+    return {"matches": matches, "analyzed_pages": text_index.analyzed_pages(session_dir)}
+
+class ReplaceRequest(BaseModel):
+    session_id: str
+    find: str
+    replace: str
+    pages: Optional[List[int]] = None # restrict to these pages
+    style: Dict[str, Any] = {} # EditSpec fields (font, color, inpaint...) for blocks not edited yet
+    page_edits: Dict[int, List[EditSpec]] = {} # Current edit list of each page (client state)
+    dry_run: bool = False
+
+@app.post("/replace")
+async def replace_in_deck(request: ReplaceRequest):
+    """
+    Replace text in every matching block of the deck in one request: build an edit per
+    match (updating the block's existing edit if there is one) and rebuild all affected
+    pages concurrently, as /update-pages does. dry_run only returns the edits.
+    """
+    session_dir = os.path.join(TMP_DIR, request.session_id)
+    if not os.path.exists(session_dir):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    style = {k: v for k, v in request.style.items() if k not in ("bbox", "text", "units", "preview_width")}
+    try:
+        EditSpec(bbox=[0, 0, 0, 0], text="", **style)
+    except Exception as e:
+        raise HTTPException(status_code=400, detail=f"Invalid style: {e}")
+
+    # Blocks to change: index hits on the OCR text, plus edited blocks whose current
+    # (edited) text matches. A block's current text is its edit's text, if any.
+    pages = set(request.pages) if request.pages is not None else None
+    targets: Dict[Any, Dict[str, Any]] = {}
+    for m in text_index.search(session_dir, request.find, request.pages):
+        targets[(m["page_index"], tuple(m["bbox"]))] = m
+    for page_index, edits in request.page_edits.items():
+        if pages is not None and page_index not in pages:
+            continue
+        for e in edits:
+            if e.units == "px" and text_index.replace_text(e.text, request.find, request.replace) is not None:
+                targets.setdefault((page_index, tuple(e.bbox)),
+                                   {"page_index": page_index, "block_id": None, "bbox": e.bbox, "text": e.text})
+
+    matches, page_edits = [], {}
+    for (page_index, bbox), target in sorted(targets.items(), key=lambda t: t[0]):
+        edits = page_edits.setdefault(page_index, list(request.page_edits.get(page_index, [])))
+        existing = next((n for n, e in enumerate(edits) if e.units == "px" and tuple(e.bbox) == bbox), None)
+        current = edits[existing].text if existing is not None else target["text"]
+        new_text = text_index.replace_text(current, request.find, request.replace)
+        if new_text is None:
+            continue  # e.g. the block was already edited to something else
+        if existing is not None:
+            edits[existing] = edits[existing].copy(update={"text": new_text})
+        else:
+            edits.append(EditSpec(bbox=list(bbox), text=new_text, units="px", **style))
+        matches.append(dict(target, text=current, new_text=new_text))
+    changed_pages = {m["page_index"] for m in matches}
+    page_edits = {p: e for p, e in page_edits.items() if p in changed_pages}
+
+    if request.dry_run or not page_edits:
+        return {"matches": matches, "page_edits": page_edits, "results": [], "elapsed_ms": 0.0}
+
+    start = time.perf_counter()
+    rebuilds = [PageEdits(page_index=p, edits=e) for p, e in page_edits.items()]
+    results = await asyncio.gather(*[_rebuild_page_timed(request.session_id, page) for page in rebuilds])
+
+    return {
+        "matches": matches,
+        "page_edits": page_edits,
+        "results": sorted(results, key=lambda r: r["page_index"]),
+        "elapsed_ms": round((time.perf_counter() - start) * 1000, 1)
+    }
+
 class ApplyEditRequest(BaseModel):
     session_id: str
     page_index: int
@@ -237,7 +533,7 @@ async def apply_edit(request: ApplyEditRequest):
     if not os.path.exists(session_dir):
         raise HTTPException(status_code=404, detail="Session not found")
         
-    image_path = os.path.join(session_dir, f"page_{request.page_index}.png")
+    image_path = process_image.ensure_page_image(session_dir, request.page_index)
     if not os.path.exists(image_path):
         raise HTTPException(status_code=404, detail="Page image not found")
 
@@ -252,7 +548,8 @@ async def apply_edit(request: ApplyEditRequest):
             fill_color=request.fill_color
         )
         
-        return {"status": "success", "image_url": f"/tmp/{request.session_id}/page_{request.page_index}.png"}
+        return {"status": "success",
+                "image_url": page_versions.page_url(request.session_id, session_dir, f"page_{request.page_index}.png")}
     except Exception as e:
         logger.error(f"Error applying edit: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -261,14 +558,25 @@ class RestoreRequest(BaseModel):
     session_id: str
     page_index: int
 
+def restore_page_image(session_id: str, page_index: int) -> str:
+    """Revert page_{page_index}.png to its original (no-op if never edited). Returns the page image URL."""
+    session_dir = os.path.join(TMP_DIR, session_id)
+    filename = f"page_{page_index}.png"
+    editor_engine.restore_page(os.path.join(session_dir, filename))
+    if not os.path.exists(process_image.display_path(session_dir, filename)):
+        return f"/tmp/{session_id}/{filename}"
+    return page_versions.page_url(session_id, session_dir, filename)
+
 @app.post("/restore-page")
 async def restore_page(request: RestoreRequest):
-    session_dir = os.path.join(TMP_DIR, request.session_id)
-    image_path = os.path.join(session_dir, f"page_{request.page_index}.png")
-    
     try:
-        editor_engine.restore_page(image_path)
-        return {"status": "success", "image_url": f"/tmp/{request.session_id}/page_{request.page_index}.png"}
+        # Queued in order with /update-page rebuilds of the page (never interleaved), but
+        # never coalesced with them: a restore neither replaces nor is replaced by an update
+        def run():
+            return {"status": "success", "image_url": restore_page_image(request.session_id, request.page_index)}
+        return await page_updates.submit((request.session_id, request.page_index), run, coalesce=False)
+    except HTTPException:
+        raise
     except Exception as e:
         logger.error(f"Error restoring page: {e}")
         raise HTTPException(status_code=500, detail=str(e))
@@ -280,6 +588,134 @@ async def download_file(session_id: str, filename: str):
         raise HTTPException(status_code=404, detail="File not found")
     return FileResponse(file_path, filename=filename)
 
+@app.get("/metrics")
+async def metrics():
+    """CPU budget utilization and engine queues, plus background pre-inpainting progress."""
+    return {"cpu": cpu_scheduler.metrics(), "pre_inpaint": pre_inpaint.stats()}
+
+# Page images under content-hash URLs: a URL's bytes never change, so browsers and
+# proxies may cache it forever; edits produce a new URL (see page_versions).
+IMMUTABLE_CACHE_CONTROL = "public, max-age=31536000, immutable"
+
+@app.get("/pages/{session_id}/{version}/{filename}")
+async def page_image(session_id: str, version: str, filename: str,
+                     if_none_match: Optional[str] = Header(None)):
+    if not page_versions.PAGE_FILE_PATTERN.match(filename) or os.path.basename(session_id) != session_id \
+            or session_id in ("", ".", ".."):
+        raise HTTPException(status_code=404, detail="File not found")
+    image_path = process_image.display_path(os.path.join(TMP_DIR, session_id), filename)
+    if not os.path.exists(image_path):
+        raise HTTPException(status_code=404, detail="File not found")
+
+    current = page_versions.page_version(image_path)
+    if version != current:
+        # Stale URL (page edited since): point to the current version instead of caching
+        # new bytes under an old immutable URL
+        return RedirectResponse(page_versions.page_url(session_id, os.path.join(TMP_DIR, session_id), filename),
+                                status_code=307, headers={"Cache-Control": "no-cache"})
+
+    headers = {"ETag": page_versions.etag(current), "Cache-Control": IMMUTABLE_CACHE_CONTROL}
+    if page_versions.etag_matches(if_none_match, current):
+        return Response(status_code=304, headers=headers)
+    # Not yet decoded JPEG uploads are served as the original JPEG
+    media_type = "image/png" if image_path.endswith(".png") else None
+    return FileResponse(image_path, media_type=media_type, headers=headers)
+
+# --- Background Jobs ---
+# Same work as /upload and /generate, but run on a persisted job queue so long decks
+# don't hit request timeouts and interrupted jobs resume after a restart.
+
+def _upload_job(params: Dict[str, Any], ctx: job_queue.JobContext) -> Dict[str, Any]:
+    session_dir = os.path.join(TMP_DIR, params["session_id"])
+    pages = convert_input(session_dir, params["ext"], progress=ctx.progress,
+                          check_cancelled=ctx.check_cancelled, resume=True)
+    return {"session_id": params["session_id"], "pages": pages,
+            "page_urls": [page_versions.page_url(params["session_id"], session_dir, p) for p in pages]}
+
+def _generate_job(params: Dict[str, Any], ctx: job_queue.JobContext) -> Dict[str, Any]:
+    session_dir = os.path.join(TMP_DIR, params["session_id"])
+    if not os.path.exists(session_dir):
+        raise FileNotFoundError("Session not found")
+    output_path = build_output(session_dir, params["modifications"], progress=ctx.progress,
+                               check_cancelled=ctx.check_cancelled,
+                               compression=params.get("compression", "image"))
+    return {"download_url": f"/download/{params['session_id']}/{output_path}"}
+
+jobs.register("upload", _upload_job)
+jobs.register("generate", _generate_job)
+
+@app.post("/jobs/upload")
+async def upload_job_endpoint(file: UploadFile = File(...)):
+    filename = file.filename.lower()
+    ext = os.path.splitext(filename)[1]
+    
+    if ext not in [".pdf", ".png", ".jpg", ".jpeg"]:
+        raise HTTPException(status_code=400, detail="Invalid file type. Supported: PDF, PNG, JPG.")
+
+    session_id = str(uuid.uuid4())
+    session_dir = os.path.join(TMP_DIR, session_id)
+    os.makedirs(session_dir, exist_ok=True)
+
+    with open(os.path.join(session_dir, f"input{ext}"), "wb") as buffer:
+        shutil.copyfileobj(file.file, buffer)
+
+    job = jobs.submit("upload", {"session_id": session_id, "ext": ext})
+    return {"job_id": job["id"], "session_id": session_id, "status": job["status"]}
+
+@app.post("/jobs/generate")
+async def generate_job_endpoint(request: GenerateRequest):
+    session_dir = os.path.join(TMP_DIR, request.session_id)
+    if not os.path.exists(session_dir):
+        raise HTTPException(status_code=404, detail="Session not found")
+
+    if request.compression not in generate_pdf.COMPRESSIONS:
+        raise HTTPException(status_code=400, detail=f"Unknown compression '{request.compression}'")
+
+    job = jobs.submit("generate", {
+        "session_id": request.session_id,
+        "modifications": [m.model_dump() for m in request.modifications],
+        "compression": request.compression
+    })
+    return {"job_id": job["id"], "status": job["status"]}
+
+def _job_view(job: Dict[str, Any]) -> Dict[str, Any]:
+    return {k: job[k] for k in ("id", "kind", "status", "total", "completed", "message", "result", "error")}
+
+@app.get("/jobs/{job_id}")
+async def get_job(job_id: str):
+    job = jobs.store.get(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_view(job)
+
+@app.get("/jobs/{job_id}/events")
+async def job_events(job_id: str):
+    """Server-Sent Events: one 'data:' message per job update until the job finishes."""
+    if jobs.store.get(job_id) is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+
+    async def event_stream():
+        last_update = None
+        while True:
+            job = jobs.store.get(job_id)
+            if job is None:
+                break
+            if job["updated_at"] != last_update:
+                last_update = job["updated_at"]
+                yield f"data: {json.dumps(_job_view(job))}\n\n"
+            if job["status"] in job_queue.TERMINAL_STATES:
+                break
+            await asyncio.sleep(0.5)
+
+    return StreamingResponse(event_stream(), media_type="text/event-stream")
+
+@app.post("/jobs/{job_id}/cancel")
+async def cancel_job(job_id: str):
+    job = jobs.cancel(job_id)
+    if job is None:
+        raise HTTPException(status_code=404, detail="Job not found")
+    return _job_view(job)
+
 # Mount TMP for previewing images (careful in prod, ok for local tool)
 app.mount("/tmp", StaticFiles(directory=TMP_DIR), name="tmp")
 
@@ -12,6 +12,7 @@ document.addEventListener('DOMContentLoaded', () => {
 
     let currentSessionId = null;
     let currentPages = [];
+    let currentPageUrls = [];
     let pageData = {};
     let currentSelection = null;
     let activePageIndex = null;
@@ -72,20 +73,46 @@ document.addEventListener('DOMContentLoaded', () => {
         });
     }
 
+    // Poll a background job until it finishes. Returns the final job object.
+    async function waitForJob(jobId, onProgress) {
+        while (true) {
+            const resp = await fetch(`/jobs/${jobId}`);
+            const job = await resp.json();
+            if (!resp.ok) throw new Error(job.detail || 'Job not found');
+            if (onProgress) onProgress(job);
+            if (['done', 'failed', 'cancelled'].includes(job.status)) return job;
+            await new Promise(resolve => setTimeout(resolve, 500));
+        }
+    }
+
     async function handleUpload(file) {
         if (!file) return;
         uploadZone.style.display = 'none';
         loading.style.display = 'block';
 
+        const loadingText = document.getElementById('loadingText');
+        const defaultLoadingText = loadingText ? loadingText.textContent : '';
+
         const formData = new FormData();
         formData.append('file', file);
         try {
-            const resp = await fetch('/upload', { method: 'POST', body: formData });
+            const resp = await fetch('/jobs/upload', { method: 'POST', body: formData });
             const data = await resp.json();
             if (resp.ok) {
-                currentSessionId = data.session_id;
-                currentPages = data.pages;
-                initEditor();
+                const job = await waitForJob(data.job_id, (job) => {
+                    if (loadingText && job.total > 0) {
+                        loadingText.textContent = `${defaultLoadingText} (${job.completed}/${job.total})`;
+                    }
+                });
+                if (job.status === 'done') {
+                    currentSessionId = job.result.session_id;
+                    currentPages = job.result.pages;
+                    currentPageUrls = job.result.page_urls || [];
+                    initEditor();
+                } else {
+                    alert('Upload failed: ' + (job.error || job.status));
+                    uploadZone.style.display = 'block';
+                }
             } else {
                 alert('Upload failed: ' + data.detail);
                 uploadZone.style.display = 'block';
@@ -96,6 +123,7 @@ document.addEventListener('DOMContentLoaded', () => {
             uploadZone.style.display = 'block';
         } finally {
             loading.style.display = 'none';
+            if (loadingText) loadingText.textContent = defaultLoadingText;
         }
     }
 
@@ -104,7 +132,8 @@ document.addEventListener('DOMContentLoaded', () => {
         pagesContainer.innerHTML = '';
 
         currentPages.forEach((pagePath, index) => {
-            const imageUrl = `/tmp/${currentSessionId}/${pagePath}`;
+            // Versioned URL (content hash): cached by the browser until the page changes
+            const imageUrl = currentPageUrls[index] || `/tmp/${currentSessionId}/${pagePath}`;
 
             pageData[index] = {
                 blocks: [],
@@ -260,6 +289,8 @@ document.addEventListener('DOMContentLoaded', () => {
         if (fillSizeInput) fillSizeInput.disabled = !enabled;
 
         applyEditBtn.disabled = !enabled;
+        const applyAllBtn = document.getElementById('applyAllBtn');
+        if (applyAllBtn) applyAllBtn.disabled = !enabled;
         if (undoEditBtn) undoEditBtn.disabled = !enabled;
 
         if (!enabled) {
@@ -580,11 +611,8 @@ document.addEventListener('DOMContentLoaded', () => {
         }
     }
 
-    applyEditBtn.addEventListener('click', async () => {
-        if (!currentSelection) return;
-        const { pageIndex, blockId } = currentSelection;
-        const block = pageData[pageIndex].blocks.find(b => b.id === blockId);
-
+    // Read the edit panel into a modification for the given block (and remember last used styles)
+    function buildModification(block) {
         const isRemove = document.getElementById('removeTextCheckbox').checked;
         const text = isRemove ? "" : selectedInput.value;
         const fontFamily = document.getElementById('fontFamilySelect').value;
@@ -627,7 +655,7 @@ document.addEventListener('DOMContentLoaded', () => {
             lastFillColor = fillColorInput.value;
         }
 
-        pageData[pageIndex].modifications.set(blockId, {
+        return {
             bbox: block.bbox,
             text: text,
             font_family: fontFamily,
@@ -642,8 +670,15 @@ document.addEventListener('DOMContentLoaded', () => {
             fill_color: fillColor,
             fill_size: fillSize,
             is_removed: isRemove
-        });
+        };
+    }
 
+    applyEditBtn.addEventListener('click', async () => {
+        if (!currentSelection) return;
+        const { pageIndex, blockId } = currentSelection;
+        const block = pageData[pageIndex].blocks.find(b => b.id === blockId);
+
+        pageData[pageIndex].modifications.set(blockId, buildModification(block));
 
         const originalText = applyEditBtn.textContent;
         applyEditBtn.textContent = 'Applying...';
@@ -660,6 +695,62 @@ document.addEventListener('DOMContentLoaded', () => {
         updateUndoButtonState(true);
     });
 
+    // Apply the current edit to every page where the same text appears at the same position
+    const applyAllBtn = document.getElementById('applyAllBtn');
+    if (applyAllBtn) {
+        applyAllBtn.addEventListener('click', async () => {
+            if (!currentSelection) return;
+            const { pageIndex, blockId } = currentSelection;
+            const block = pageData[pageIndex].blocks.find(b => b.id === blockId);
+            const mod = buildModification(block);
+
+            const pageEdits = {};
+            Object.keys(pageData).forEach(pIdx => {
+                pageEdits[pIdx] = Array.from(pageData[pIdx].modifications.values());
+            });
+
+            const originalText = applyAllBtn.textContent;
+            applyAllBtn.textContent = 'Applying...';
+            applyAllBtn.disabled = true;
+
+            try {
+                const resp = await fetch('/apply-to-all', {
+                    method: 'POST',
+                    headers: { 'Content-Type': 'application/json' },
+                    body: JSON.stringify({
+                        session_id: currentSessionId,
+                        page_index: pageIndex,
+                        block_id: blockId,
+                        edit: mod,
+                        page_edits: pageEdits
+                    })
+                });
+                const data = await resp.json();
+                if (resp.ok) {
+                    data.occurrences.forEach(occ => {
+                        if (!pageData[occ.page_index]) return;
+                        pageData[occ.page_index].modifications.set(occ.block_id, { ...mod, bbox: occ.bbox });
+                        const rBtn = document.getElementById(`restoreBtn-${occ.page_index}`);
+                        if (rBtn) rBtn.disabled = false;
+                    });
+                    data.results.forEach(r => {
+                        const img = document.getElementById(`pageImg-${r.page_index}`);
+                        if (img && r.image_url) img.src = r.image_url;
+                    });
+                    updateUndoButtonState(true);
+                } else {
+                    alert('Update failed: ' + data.detail);
+                }
+            } catch (e) {
+                console.error(e);
+                alert('Error updating pages');
+            } finally {
+                applyAllBtn.textContent = originalText;
+                applyAllBtn.disabled = false;
+            }
+        });
+    }
+
     if (undoEditBtn) {
         undoEditBtn.addEventListener('click', async () => {
             if (!currentSelection) return;
@@ -692,7 +783,7 @@ document.addEventListener('DOMContentLoaded', () => {
             const data = await resp.json();
             if (resp.ok) {
                 const img = document.getElementById(`pageImg-${pageIndex}`);
-                img.src = `${data.image_url}?t=${new Date().getTime()}`;
+                img.src = data.image_url;
             } else {
                 alert('Update failed: ' + data.detail);
             }
@@ -725,14 +816,22 @@ document.addEventListener('DOMContentLoaded', () => {
         });
 
         try {
-            const resp = await fetch('/generate', {
+            const resp = await fetch('/jobs/generate', {
                 method: 'POST',
                 headers: { 'Content-Type': 'application/json' },
                 body: JSON.stringify({ session_id: currentSessionId, modifications: modifications })
             });
 
-            const data = await resp.json();
+            let data = await resp.json();
             if (resp.ok) {
+                const job = await waitForJob(data.job_id, (job) => {
+                    if (job.total > 0) downloadBtn.textContent = `Generating... ${job.completed}/${job.total}`;
+                });
+                if (job.status !== 'done') {
+                    alert('Generation failed: ' + (job.error || job.status));
+                    return;
+                }
+                data = job.result;
                 const a = document.createElement('a');
                 a.href = data.download_url;
                 a.download = 'edited.pdf';
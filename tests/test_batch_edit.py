@@ -0,0 +1,26 @@
+import os
+
+import fitz
+
+from execution import batch_edit, cpu_scheduler
+
+
+def test_worker_gives_each_engine_its_share_of_the_cores(tmp_path, monkeypatch):
+    for var in ("OMP_NUM_THREADS", "MKL_NUM_THREADS", "OPENBLAS_NUM_THREADS",
+                "CPU_CORES", "OCR_THREADS", "INPAINT_THREADS"):
+        monkeypatch.setenv(var, os.environ.get(var, ""))  # restored after the test
+    pdf_path = os.path.join(tmp_path, "in.pdf")
+    with fitz.open() as doc:
+        doc.new_page()
+        doc.save(pdf_path)
+
+    try:
+        batch_edit._init_worker(pdf_path, 2)
+        assert os.environ["CPU_CORES"] == "2"
+        assert cpu_scheduler.CPU_CORES == 2
+        assert cpu_scheduler.threads_for("ocr") == 2
+        assert cpu_scheduler.threads_for("inpaint") == 2
+    finally:
+        batch_edit._worker_doc.close()
+        monkeypatch.undo()
+        cpu_scheduler.configure()
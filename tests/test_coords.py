@@ -0,0 +1,50 @@
+import pytest
+
+from execution import coords
+
+BBOX = [12.5, 30.0, 200.25, 48.0]
+
+
+def _close(a, b):
+    return all(abs(u - v) < 1e-9 for u, v in zip(a, b)) and len(a) == len(b)
+
+
+@pytest.mark.parametrize("geom", [
+    coords.make_geometry(0, 720.0, 405.0, 2000, 1125, 200.0),
+    coords.make_geometry(1, 612.0, 792.0, 850, 1100, 100.0),
+    # Embedded image covering part of the page: offset origin, unequal x / y scale
+    coords.make_geometry(2, 720.0, 540.0, 1000, 400, None, image_rect=[36.0, 72.0, 636.0, 372.0]),
+    coords.image_geometry(3, 1280, 720),
+])
+def test_pt_px_and_preview_round_trips(geom):
+    assert _close(coords.px_to_pt(coords.pt_to_px(BBOX, geom), geom), BBOX)
+    assert _close(coords.pt_to_px(coords.px_to_pt(BBOX, geom), geom), BBOX)
+    assert _close(coords.preview_to_px(coords.px_to_preview(BBOX, geom, 640), geom, 640), BBOX)
+
+
+def test_geometry_maps_page_corners():
+    geom = coords.make_geometry(0, 720.0, 540.0, 1000, 400, None, image_rect=[36.0, 72.0, 636.0, 372.0])
+    assert _close(coords.pt_to_px([36.0, 72.0, 600.0, 300.0], geom), [0.0, 0.0, 1000.0, 400.0])
+
+    geom = coords.make_geometry(0, 720.0, 405.0, 2000, 1125, 200.0)
+    assert _close(coords.to_px([0, 0, 720.0, 405.0], geom, "pt"), [0.0, 0.0, 2000.0, 1125.0])
+    assert _close(coords.to_px([0, 0, 1000, 562.5], geom, "preview", preview_width=1000), [0.0, 0.0, 2000.0, 1125.0])
+
+
+def test_to_px_errors():
+    geom = coords.image_geometry(0, 100, 100)
+    assert coords.to_px(BBOX, None, "px") == BBOX
+    with pytest.raises(ValueError):
+        coords.to_px(BBOX, None, "pt")
+    with pytest.raises(ValueError):
+        coords.to_px(BBOX, geom, "preview")
+    with pytest.raises(ValueError):
+        coords.to_px(BBOX, geom, "inch")
+
+
+def test_geometry_is_saved_per_session(tmp_path):
+    pages = [coords.make_geometry(i, 720.0, 405.0, 1000, 562, 100.0) for i in range(3)]
+    coords.save_geometry(str(tmp_path), pages)
+    assert coords.get_page_geometry(str(tmp_path), 2) == pages[2]
+    assert coords.get_page_geometry(str(tmp_path), 5) is None
+    assert coords.load_geometry(str(tmp_path / "missing")) == []
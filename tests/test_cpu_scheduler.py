@@ -0,0 +1,74 @@
+import threading
+import time
+
+from execution import cpu_scheduler
+
+
+def test_default_budgets_split_the_cores(monkeypatch):
+    for var in ("CPU_CORES", "OCR_THREADS", "INPAINT_THREADS"):
+        monkeypatch.delenv(var, raising=False)
+    try:
+        cpu_scheduler.configure(cpu_cores=8)
+        assert cpu_scheduler.threads_for("ocr") == 4
+        assert cpu_scheduler.threads_for("inpaint") == 4
+
+        cpu_scheduler.configure(cpu_cores=3, ocr_threads=2)
+        assert (cpu_scheduler.threads_for("ocr"), cpu_scheduler.threads_for("inpaint")) == (2, 1)
+
+        monkeypatch.setenv("CPU_CORES", "2")
+        cpu_scheduler.configure()
+        assert cpu_scheduler.CPU_CORES == 2
+        assert cpu_scheduler.threads_for("ocr") + cpu_scheduler.threads_for("inpaint") == 2
+    finally:
+        monkeypatch.delenv("CPU_CORES", raising=False)
+        cpu_scheduler.configure()
+
+
+def test_budgets_are_clamped_to_the_cores():
+    try:
+        cpu_scheduler.configure(cpu_cores=2, ocr_threads=16, inpaint_threads=16)
+        assert cpu_scheduler.threads_for("ocr") == 2
+        assert cpu_scheduler.threads_for("inpaint") == 2
+    finally:
+        cpu_scheduler.configure()
+
+
+def test_slot_serializes_jobs_on_the_engine_lock_and_counts_them():
+    lock = threading.Lock()
+    before = cpu_scheduler.metrics()["engines"]["ocr"]["completed"]
+    running, peak = [0], [0]
+    count_lock = threading.Lock()
+
+    def job():
+        with cpu_scheduler.slot("ocr", lock):
+            with count_lock:
+                running[0] += 1
+                peak[0] = max(peak[0], running[0])
+            time.sleep(0.02)
+            with count_lock:
+                running[0] -= 1
+
+    threads = [threading.Thread(target=job) for _ in range(4)]
+    for t in threads:
+        t.start()
+    for t in threads:
+        t.join()
+
+    metrics = cpu_scheduler.metrics()
+    assert peak[0] == 1
+    assert metrics["engines"]["ocr"]["completed"] == before + 4
+    assert metrics["engines"]["ocr"]["running"] == 0
+    assert metrics["engines"]["ocr"]["queued"] == 0
+    assert metrics["busy_cores"] == 0
+    assert not lock.locked()
+
+
+def test_slot_releases_the_lock_on_error():
+    lock = threading.Lock()
+    try:
+        with cpu_scheduler.slot("inpaint", lock):
+            raise RuntimeError("model failed")
+    except RuntimeError:
+        pass
+    assert not lock.locked()
+    assert cpu_scheduler.metrics()["engines"]["inpaint"]["running"] == 0
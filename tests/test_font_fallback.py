@@ -0,0 +1,46 @@
+import os
+
+import numpy as np
+from PIL import Image
+
+from execution import editor_engine, font_registry
+
+
+def _ink_rows(image_path):
+    dark = np.asarray(Image.open(image_path).convert("L")) < 128
+    rows = np.nonzero(dark.any(axis=1))[0]
+    return rows.min(), rows.max()
+
+
+def _edit(tmp_path, name, font_family):
+    image_path = os.path.join(tmp_path, name)
+    Image.new("RGB", (600, 200), "white").save(image_path)
+    editor_engine.apply_edit(image_path, [50, 60, 500, 60], "Hg", font_family=font_family,
+                             inpaint_method="simple_filled", fill_color="#ffffff")
+    return image_path
+
+
+def test_fallback_fonts_are_installed_faces():
+    installed = font_registry.available_faces()
+    fallbacks = editor_engine.get_fallback_fonts(False, False)
+    assert fallbacks and set(fallbacks) <= set(installed)
+
+
+def test_missing_primary_font_uses_an_installed_face():
+    primary = os.path.basename(editor_engine.get_font_path(editor_engine.DEFAULT_FONT_FAMILY, False, False))
+    if primary in font_registry.available_faces():
+        return  # the deployment ships the default face
+
+    runs = editor_engine.get_font_runs("Hello", editor_engine.DEFAULT_FONT_FAMILY, False, False)
+    assert runs == [(os.path.join(editor_engine.FONTS_DIR, editor_engine.get_fallback_fonts(False, False)[0]), "Hello")]
+
+
+def test_fallback_runs_are_centred_like_single_font_text(tmp_path, monkeypatch):
+    single = _ink_rows(_edit(tmp_path, "single.png", "Roboto"))
+
+    # Same font split into two runs: drawn by the fallback (run by run) path
+    path = editor_engine.get_font_path("Roboto", False, False)
+    monkeypatch.setattr(editor_engine, "get_font_runs", lambda *args: [(path, "H"), (path, "g")])
+    runs = _ink_rows(_edit(tmp_path, "runs.png", "Roboto"))
+
+    assert abs(single[0] - runs[0]) <= 1 and abs(single[1] - runs[1]) <= 1
@@ -0,0 +1,78 @@
+import os
+
+import fitz  # PyMuPDF
+import numpy as np
+import pytest
+from PIL import Image, ImageDraw
+
+from execution import coords, editor_engine, generate_pdf
+
+
+def _text_mask(layers):
+    """Unpack the MRC stencil mask into a boolean (H, W) array, True = text."""
+    packed = np.frombuffer(layers["mask"], np.uint8).reshape(layers["height"], -1)
+    return ~np.unpackbits(packed, axis=1)[:, :layers["width"]].astype(bool)
+
+
+def test_mrc_mask_covers_edited_text_outside_the_ocr_box(tmp_path):
+    image_path = os.path.join(tmp_path, "page_0.png")
+    img = Image.new("RGB", (800, 450), "#f4f1ea")
+    ImageDraw.Draw(img).rectangle([100, 100, 500, 140], fill="#203040")
+    img.save(image_path)
+    bbox = [100, 100, 400, 40]
+
+    editor_engine.apply_edit(image_path, bbox, "Edited", inpaint_method="simple_filled",
+                             font_size=60, offset_y=200)
+
+    edited = np.asarray(Image.open(image_path).convert("RGB")).astype(int)
+    dark = edited.max(axis=2) < 128
+    moved = dark.copy()
+    moved[:bbox[1] + bbox[3] + generate_pdf.MRC_TEXT_PAD + 1] = False
+    assert moved.sum() > 100  # the edit drew text below its OCR box
+
+    mask = _text_mask(generate_pdf._mrc_layers(image_path, [bbox]))
+    assert (mask & moved).sum() >= 0.95 * moved.sum()
+
+
+def test_mrc_without_edits_only_searches_the_ocr_boxes(tmp_path):
+    image_path = os.path.join(tmp_path, "page_0.png")
+    img = Image.new("RGB", (400, 200), "white")
+    draw = ImageDraw.Draw(img)
+    draw.rectangle([20, 20, 120, 40], fill="black")
+    draw.rectangle([20, 120, 120, 140], fill="black")
+    img.save(image_path)
+
+    mask = _text_mask(generate_pdf._mrc_layers(image_path, [[20, 20, 100, 20]]))
+    assert mask[20:41, 20:121].all()
+    assert not mask[100:].any()
+
+
+def _render(session_dir, filename):
+    with fitz.open(os.path.join(session_dir, filename)) as doc:
+        return doc[0].get_pixmap(dpi=100).samples
+
+
+@pytest.mark.parametrize("compression", generate_pdf.COMPRESSIONS)
+def test_export_after_restore_is_not_served_from_the_edited_encoding(tmp_path, compression):
+    session_dir = str(tmp_path)
+    image_path = os.path.join(session_dir, "page_0.png")
+    img = Image.new("RGB", (800, 450), "#f4f1ea")
+    ImageDraw.Draw(img).rectangle([100, 100, 500, 160], fill="#203040")
+    img.save(image_path)
+    coords.save_geometry(session_dir, [coords.make_geometry(0, 576.0, 324.0, 800, 450, 100.0)])
+    with open(image_path, "rb") as f:
+        original_bytes = f.read()
+
+    before = _render(session_dir, generate_pdf.create_pdf(session_dir, [], compression=compression))
+
+    editor_engine.apply_edit(image_path, [100, 100, 400, 60], "Edited", inpaint_method="simple_filled")
+    edited = _render(session_dir, generate_pdf.create_pdf(session_dir, [], compression=compression))
+
+    # restore_page copies the older .original back: the .encoded cache must notice
+    editor_engine.restore_page(image_path)
+    after = _render(session_dir, generate_pdf.create_pdf(session_dir, [], compression=compression))
+
+    with open(image_path, "rb") as f:
+        assert f.read() == original_bytes
+    assert edited != before
+    assert after == before
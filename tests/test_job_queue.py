@@ -0,0 +1,102 @@
+import threading
+
+import pytest
+
+from execution import job_queue
+
+
+def _queue(tmp_path, handler, kind="work"):
+    jobs = job_queue.JobQueue(job_queue.JobStore(str(tmp_path / "jobs")))
+    jobs.register(kind, handler)
+    return jobs
+
+
+def test_job_runs_with_progress(tmp_path):
+    def handler(params, ctx):
+        for page in range(params["pages"]):
+            ctx.progress(page + 1, params["pages"])
+        return {"pages": params["pages"]}
+
+    jobs = _queue(tmp_path, handler)
+    jobs.start()
+    job = jobs.submit("work", {"pages": 3})
+    jobs._queue.join()
+
+    job = jobs.store.get(job["id"])
+    assert job["status"] == job_queue.DONE
+    assert (job["completed"], job["total"], job["result"]) == (3, 3, {"pages": 3})
+
+
+def test_cancel_queued_job_never_runs(tmp_path):
+    ran = []
+    jobs = _queue(tmp_path, lambda params, ctx: ran.append(params))
+    job = jobs.submit("work", {})
+
+    assert jobs.cancel(job["id"])["status"] == job_queue.CANCELLED
+    jobs.start()
+    jobs._queue.join()
+    assert ran == []
+    assert jobs.store.get(job["id"])["status"] == job_queue.CANCELLED
+
+
+def test_cancel_running_job_stops_at_next_check(tmp_path):
+    started, release = threading.Event(), threading.Event()
+    pages = []
+
+    def handler(params, ctx):
+        for page in range(10):
+            if page == 1:
+                started.set()
+                release.wait(5)
+            ctx.check_cancelled()
+            pages.append(page)
+        return {}
+
+    jobs = _queue(tmp_path, handler)
+    jobs.start()
+    job = jobs.submit("work", {})
+    assert started.wait(5)
+
+    assert jobs.cancel(job["id"])["cancel_requested"]
+    release.set()
+    jobs._queue.join()
+    assert pages == [0]
+    assert jobs.store.get(job["id"])["status"] == job_queue.CANCELLED
+    assert jobs.cancel(job["id"])["status"] == job_queue.CANCELLED  # terminal: unchanged
+
+
+def test_failed_job_records_the_error(tmp_path):
+    def handler(params, ctx):
+        raise RuntimeError("disk full")
+
+    jobs = _queue(tmp_path, handler)
+    jobs.start()
+    job = jobs.submit("work", {})
+    jobs._queue.join()
+    job = jobs.store.get(job["id"])
+    assert (job["status"], job["error"]) == (job_queue.FAILED, "disk full")
+
+
+def test_unfinished_jobs_resume_after_restart(tmp_path):
+    store = job_queue.JobStore(str(tmp_path / "jobs"))
+    queued = store.create("work", {"n": 2})
+    store.update(queued["id"], created_at=2.0)
+    running = store.create("work", {"n": 1})
+    store.update(running["id"], status=job_queue.RUNNING, completed=2, total=5, created_at=1.0)
+    done = store.create("work", {"n": 3})
+    store.update(done["id"], status=job_queue.DONE)
+
+    ran = []
+    jobs = _queue(tmp_path, lambda params, ctx: ran.append(params["n"]) or {})
+    jobs.start()
+    jobs._queue.join()
+    assert ran == [1, 2]  # oldest first, finished jobs skipped
+    assert jobs.store.get(queued["id"])["status"] == job_queue.DONE
+
+
+def test_unknown_kind_and_path_like_ids_are_rejected(tmp_path):
+    jobs = _queue(tmp_path, lambda params, ctx: {})
+    with pytest.raises(ValueError):
+        jobs.submit("other", {})
+    assert jobs.store.get("../jobs/x") is None
+    assert jobs.store.get("") is None
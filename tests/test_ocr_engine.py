@@ -0,0 +1,22 @@
+from execution import ocr_engine
+
+
+def test_parse_paddle_2x_result():
+    # PaddleOCR 2.7 (pinned): one list per image of [box, (text, score)]
+    result = [[
+        [[[10, 20], [110, 20], [110, 50], [10, 50]], ("Title", 0.98765)],
+        [[[10, 60], [60, 60], [60, 80], [10, 80]], ("  ", 0.9)],
+    ]]
+    blocks = ocr_engine._parse_paddle_result(result)
+    assert blocks == [{"id": 0, "text": "Title", "bbox": [10, 20, 100, 30], "confidence": 0.9877}]
+
+
+def test_parse_empty_result():
+    assert ocr_engine._parse_paddle_result(None) == []
+    assert ocr_engine._parse_paddle_result([None]) == []
+
+
+def test_mock_engine_blocks():
+    blocks = ocr_engine.analyze_image("unused.png", engine="mock")
+    assert [b["id"] for b in blocks] == list(range(5))
+    assert all(len(b["bbox"]) == 4 for b in blocks)
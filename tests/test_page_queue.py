@@ -0,0 +1,84 @@
+import asyncio
+import threading
+from concurrent.futures import ThreadPoolExecutor
+
+from execution.page_queue import PageUpdateQueue
+
+
+def _run(scenario):
+    with ThreadPoolExecutor(max_workers=2) as executor:
+        return asyncio.run(scenario(PageUpdateQueue(executor)))
+
+
+def _rebuild(name, ran, gate=None):
+    def rebuild():
+        if gate is not None:
+            gate.wait(5)
+        ran.append(name)
+        return {"status": "success", "image_url": name}
+    return rebuild
+
+
+async def _settle():
+    for _ in range(10):
+        await asyncio.sleep(0)
+
+
+def test_burst_runs_first_and_latest_only():
+    ran, gate = [], threading.Event()
+
+    async def scenario(queue):
+        first = asyncio.ensure_future(queue.submit("p", _rebuild("a", ran, gate)))
+        await _settle()
+        rest = [asyncio.ensure_future(queue.submit("p", _rebuild(n, ran))) for n in "bcd"]
+        await _settle()
+        gate.set()
+        return await first, await asyncio.gather(*rest)
+
+    first, (b, c, d) = _run(scenario)
+    assert ran == ["a", "d"]
+    assert first == {"status": "success", "image_url": "a"}
+    assert d == {"status": "success", "image_url": "d"}
+    for result in (b, c):
+        assert result == {"status": "superseded", "superseded_by": 4, "image_url": "d"}
+
+
+def test_non_coalescing_requests_run_in_order():
+    ran, gate = [], threading.Event()
+
+    async def scenario(queue):
+        first = asyncio.ensure_future(queue.submit("p", _rebuild("update-1", ran, gate)))
+        await _settle()
+        rest = [
+            asyncio.ensure_future(queue.submit("p", _rebuild("update-2", ran))),
+            asyncio.ensure_future(queue.submit("p", _rebuild("restore", ran), coalesce=False)),
+            asyncio.ensure_future(queue.submit("p", _rebuild("update-3", ran))),
+            asyncio.ensure_future(queue.submit("p", _rebuild("update-4", ran))),
+        ]
+        await _settle()
+        gate.set()
+        await first
+        return await asyncio.gather(*rest)
+
+    update_2, restore, update_3, update_4 = _run(scenario)
+    # The restore neither replaces update-2 nor is replaced by update-3; update-4 replaces update-3
+    assert ran == ["update-1", "update-2", "restore", "update-4"]
+    assert update_2["status"] == restore["status"] == update_4["status"] == "success"
+    assert update_3 == {"status": "superseded", "superseded_by": 5, "image_url": "update-4"}
+
+
+def test_errors_reach_the_caller_and_free_the_page():
+    async def scenario(queue):
+        def fail():
+            raise ValueError("boom")
+        try:
+            await queue.submit("p", fail)
+        except ValueError as e:
+            error = str(e)
+        result = await queue.submit("p", _rebuild("after", []))
+        return error, result, queue._pages
+
+    error, result, pages = _run(scenario)
+    assert error == "boom"
+    assert result["image_url"] == "after"
+    assert pages == {}
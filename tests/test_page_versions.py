@@ -0,0 +1,39 @@
+import os
+
+from execution import page_versions
+
+
+def test_etag_matches_lists_weak_tags_and_wildcard():
+    version = "0123456789abcdef"
+    assert page_versions.etag_matches('"0123456789abcdef"', version)
+    assert page_versions.etag_matches('W/"0123456789abcdef"', version)
+    assert page_versions.etag_matches('"other", W/"0123456789abcdef"', version)
+    assert page_versions.etag_matches("*", version)
+
+
+def test_etag_does_not_match_other_or_missing_tags():
+    version = "0123456789abcdef"
+    assert not page_versions.etag_matches(None, version)
+    assert not page_versions.etag_matches("", version)
+    assert not page_versions.etag_matches('"fedcba9876543210"', version)
+    assert not page_versions.etag_matches("0123456789abcdef", version)  # unquoted
+
+
+def test_version_follows_content_and_url_embeds_it(tmp_path):
+    image_path = os.path.join(tmp_path, "page_0.png")
+
+    def write(data, mtime_ns):
+        with open(image_path, "wb") as f:
+            f.write(data)
+        os.utime(image_path, ns=(mtime_ns, mtime_ns))
+
+    write(b"first", 1_000_000_000)
+    first = page_versions.page_version(image_path)
+    assert len(first) == page_versions.VERSION_LENGTH
+    assert page_versions.page_url("s", str(tmp_path), "page_0.png") == f"/pages/s/{first}/page_0.png"
+
+    write(b"frist", 2_000_000_000)  # same size, newer mtime: the memo must not serve the old hash
+    assert page_versions.page_version(image_path) != first
+
+    write(b"first", 3_000_000_000)  # same bytes again (e.g. restore_page): same version
+    assert page_versions.page_version(image_path) == first
@@ -0,0 +1,43 @@
+import os
+
+from PIL import Image, ImageDraw
+
+from execution import editor_engine
+
+
+class FakeLama:
+    """Stands in for SimpleLama: fills the masked area with black."""
+    def __init__(self):
+        self.calls = 0
+
+    def __call__(self, img, mask):
+        self.calls += 1
+        out = img.copy()
+        out.paste((0, 0, 0), mask=mask)
+        return out
+
+
+def test_precompute_with_shared_image_keys_every_block_on_the_original(tmp_path, monkeypatch):
+    model = FakeLama()
+    monkeypatch.setattr(editor_engine, "get_lama_model", lambda: model)
+    monkeypatch.setattr(editor_engine, "_patch_cache", type(editor_engine._patch_cache)())
+    monkeypatch.setattr(editor_engine, "_patch_cache_bytes", 0)
+
+    image_path = os.path.join(tmp_path, "page_0.png")
+    page = Image.new("RGB", (400, 200), "white")
+    draw = ImageDraw.Draw(page)
+    draw.rectangle([20, 20, 120, 50], fill="red")
+    draw.rectangle([20, 60, 120, 90], fill="blue")  # within PATCH_CONTEXT of the first block
+    page.save(image_path)
+    blocks = [[20, 20, 100, 30], [20, 60, 100, 30]]
+
+    img = editor_engine.load_inpaint_source(image_path)
+    for bbox in blocks:
+        assert editor_engine.precompute_patch(image_path, bbox, "100%", img=img)
+
+    assert img.tobytes() == page.tobytes()  # the shared decode is left untouched
+    for bbox in blocks:
+        expanded = editor_engine.get_fill_bbox(bbox, "100%")
+        key = editor_engine._patch_key(page, editor_engine._lama_patch_box(expanded, page.size), "lama")
+        assert editor_engine._cached_patch(key) is not None
+    assert model.calls == 2
@@ -0,0 +1,40 @@
+from execution.text_index import TextIndex, replace_text
+
+
+def test_replace_keeps_unmatched_characters_as_they_were():
+    assert replace_text("Hello，World！", "world", "There") == "Hello，There！"
+    assert replace_text("Quarterly  Report\nQ3", "quarterly report", "Annual Review") == "Annual Review\nQ3"
+
+
+def test_replace_splices_matches_of_expanded_or_composed_characters():
+    # NFKC expands the ligature to two characters; both map back to the one original
+    assert replace_text("ﬁnal ﬁle", "file", "doc") == "ﬁnal doc"
+    assert replace_text("ＡＢＣ test", "abc", "x") == "x test"
+    # A decomposed accent is normalized with its base character
+    assert replace_text("Café menu", "café", "Bar") == "Bar menu"
+
+
+def test_replace_cjk_and_repeated_matches():
+    assert replace_text("簡報標題 簡報", "簡報", "投影片") == "投影片標題 投影片"
+    assert replace_text("aaa", "aa", "b") == "ba"
+
+
+def test_replace_without_a_match_returns_none():
+    assert replace_text("abc", "xyz", "q") is None
+    assert replace_text("abc", "  ", "q") is None
+
+
+def test_search_and_reindexing_a_page():
+    index = TextIndex()
+    index.update_page(0, [{"id": 1, "text": "Quarterly Report", "bbox": [0, 0, 1, 1]},
+                          {"id": 2, "text": "簡報標題", "bbox": [0, 0, 1, 1]}])
+    index.update_page(1, [{"id": 1, "text": "report card", "bbox": [0, 0, 1, 1]}])
+
+    found = lambda query: [(m["page_index"], m["block_id"]) for m in index.search(query)]
+    assert found("REPORT") == [(0, 1), (1, 1)]
+    assert found("erly rep") == [(0, 1)]  # edge words of the query may be partial
+    assert found("報標") == [(0, 2)]
+
+    index.update_page(1, [])
+    assert found("card") == []
+    assert "w:card" not in index.postings